@@ -0,0 +1,144 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import warnings
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from explainer import TreePathExplainer
+from feature_encoder import INPUT_COLUMNS, FeatureEncoder
+from model_bundle import DEFAULT_BUNDLE_PATH, ModelBundle
+from schemas import Data, validate_rows
+
+ARTIFACTS = ['Bagging_dt.pkl', 'mappings.pkl', 'standard_scaler.pkl', 'job_train_unique.pkl',
+             'education_train_unique.pkl', 'marital_train_unique.pkl', 'month_train_unique.pkl', 'dow_train_unique.pkl']
+
+DEFAULT_SIZES = [1, 100, 10000, 1000000]
+
+
+def synthetic_rows(csv_path, n_rows, seed=0):
+    """Valid raw records whose columns are drawn independently from the empirical distributions of csv_path."""
+    data = pd.read_csv(csv_path, usecols=INPUT_COLUMNS).dropna()
+    data['job'] = data['job'].str.replace('.', '')
+    data['duration'] = data['duration'].astype(int)
+    rng = np.random.default_rng(seed)
+    columns = {col: data[col].to_numpy()[rng.integers(0, len(data), n_rows)] for col in INPUT_COLUMNS}
+    return pd.DataFrame(columns).to_dict('records')
+
+
+def measure(fn, budget, min_repeats=3, max_repeats=200):
+    """Run fn repeatedly for about `budget` seconds and return the timings in seconds."""
+    timings = []
+    deadline = time.perf_counter() + budget
+    while len(timings) < max_repeats and (len(timings) < min_repeats or time.perf_counter() < deadline):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return np.array(timings)
+
+
+def summarize(stage, n_rows, timings):
+    p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+    return {'stage': stage, 'rows': n_rows, 'repeats': len(timings), 'p50_ms': p50 * 1000, 'p95_ms': p95 * 1000,
+            'p99_ms': p99 * 1000, 'rows_per_sec': n_rows / p50}
+
+
+def load_pickles():
+    return [joblib.load(path) for path in ARTIFACTS]
+
+
+def run(sizes, csv_path, bundle_path, budget, max_http_rows):
+    from fastapi.testclient import TestClient
+
+    import prediction_FastAPI
+
+    warnings.filterwarnings('ignore', message='X does not have valid feature names')
+    results = []
+
+    def record(stage, n_rows, fn):
+        results.append(summarize(stage, n_rows, measure(fn, budget)))
+        result = results[-1]
+        print(f"{stage:<16} {n_rows:>8} rows  p50 {result['p50_ms']:>10.3f} ms  p95 {result['p95_ms']:>10.3f} ms  "
+              f"p99 {result['p99_ms']:>10.3f} ms  {result['rows_per_sec']:>12,.0f} rows/s", file=sys.stderr)
+
+    record('load_pickles', 0, load_pickles)
+    record('load_bundle', 0, lambda: ModelBundle.open(bundle_path).encoder)
+
+    model, mappings, scaler, *vocabularies = load_pickles()
+    encoder = FeatureEncoder.from_artifacts(model, mappings, scaler, *vocabularies)
+    compiled = ModelBundle.open(bundle_path).model
+    explainer = TreePathExplainer.from_model(compiled)
+    # The http stage repeats the same rows, which the prediction cache would answer without scoring them
+    prediction_FastAPI.prediction_cache = None
+    client = TestClient(prediction_FastAPI.app)
+
+    for n_rows in sizes:
+        rows = synthetic_rows(csv_path, n_rows)
+        if n_rows == 1:
+            record('validate', n_rows, lambda: Data(**rows[0]))
+        else:
+            record('validate', n_rows, lambda: validate_rows(rows))
+        valid_rows = validate_rows(rows)[1]
+        record('encode', n_rows, lambda: encoder.encode_records(valid_rows))
+        features = encoder.encode_records(valid_rows)
+        frame = encoder.to_frame(features)
+        record('predict_sklearn', n_rows, lambda: model.predict(frame))
+        record('predict_compiled', n_rows, lambda: compiled.predict(features))
+        record('explain', n_rows, lambda: explainer.explain(features))
+        if n_rows <= max_http_rows:
+            if n_rows == 1:
+                record('http', n_rows, lambda: client.post('/predict/', json=rows[0]))
+            else:
+                record('http', n_rows, lambda: client.post('/predict/batch', json={'records': rows}))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Stages whose p50 got slower than the baseline by more than `tolerance` (a fraction)."""
+    previous = {(entry['stage'], entry['rows']): entry for entry in baseline['results']}
+    regressions = []
+    for entry in results:
+        before = previous.get((entry['stage'], entry['rows']))
+        if before is None:
+            continue
+        change = entry['p50_ms'] / before['p50_ms'] - 1
+        status = 'REGRESSION' if change > tolerance else 'ok'
+        print(f"{entry['stage']:<16} {entry['rows']:>8} rows  p50 {before['p50_ms']:>10.3f} -> "
+              f"{entry['p50_ms']:>10.3f} ms ({change:+.1%}) {status}", file=sys.stderr)
+        if change > tolerance:
+            regressions.append({**entry, 'baseline_p50_ms': before['p50_ms'], 'change': change})
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-stage latency and throughput benchmark of the prediction pipeline.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="Batch sizes to benchmark")
+    parser.add_argument('--data', default='bank_marketing_data.csv', help="CSV whose distributions the rows follow")
+    parser.add_argument('--bundle', default=DEFAULT_BUNDLE_PATH)
+    parser.add_argument('--budget', type=float, default=2.0, help="Approximate seconds spent per stage and size")
+    parser.add_argument('--max-http-rows', type=int, default=10000, help="Largest batch sent through HTTP")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', default=None, help="Earlier --output file to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.10, help="Allowed p50 slowdown against the baseline")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.data, args.bundle, args.budget, args.max_http_rows)
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpu_count': os.cpu_count(), 'numpy': np.__version__, 'pandas': pd.__version__},
+        'results': results,
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            report['regressions'] = compare(results, json.load(f), args.tolerance)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}", file=sys.stderr)
+    if report.get('regressions'):
+        raise SystemExit(1)
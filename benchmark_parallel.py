@@ -0,0 +1,46 @@
+import argparse
+import os
+import time
+import warnings
+
+import joblib
+import numpy as np
+
+from compiled_model import load_reference_features
+from model_bundle import DEFAULT_BUNDLE_PATH, load_bundle
+from parallel_inference import ParallelPredictor
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare sklearn model.predict with the process-pool predictor.")
+    parser.add_argument('--bundle', default=DEFAULT_BUNDLE_PATH)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    warnings.filterwarnings('ignore', message='X does not have valid feature names')
+    model = joblib.load('Bagging_dt.pkl')
+    bundle = load_bundle(args.bundle)
+    reference = load_reference_features(bundle.encoder).to_numpy()
+    rng = np.random.default_rng(0)
+
+    print(f"{'rows':>9} {'sklearn rows/s':>15} {'compiled rows/s':>16} {f'pool x{args.workers} rows/s':>16} {'speedup':>8}")
+    with ParallelPredictor(args.bundle, workers=args.workers) as pool:
+        for n_rows in args.rows:
+            features = reference[rng.integers(0, len(reference), n_rows)]
+            assert np.array_equal(pool.predict(features), model.predict(features))
+            sklearn_time = best_of(lambda: model.predict(features), args.repeat)
+            compiled_time = best_of(lambda: bundle.model.predict(features), args.repeat)
+            pool_time = best_of(lambda: pool.predict(features), args.repeat)
+            print(f"{n_rows:>9} {n_rows / sklearn_time:>15,.0f} {n_rows / compiled_time:>16,.0f} "
+                  f"{n_rows / pool_time:>16,.0f} {sklearn_time / pool_time:>7.1f}x")
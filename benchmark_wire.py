@@ -0,0 +1,85 @@
+import argparse
+import asyncio
+import time
+import warnings
+
+import orjson
+import pandas as pd
+
+import prediction_FastAPI
+from benchmark import synthetic_rows
+from wire_formats import ARROW, JSON, MSGPACK, decode_predictions, encode_request
+
+# name -> (request body builder, media type)
+FORMATS = {
+    'json-records': (lambda frame: orjson.dumps({"records": frame.to_dict('records')}), JSON),
+    'json-columns': (lambda frame: encode_request(frame, JSON), JSON),
+    'msgpack': (lambda frame: encode_request(frame, MSGPACK), MSGPACK),
+    'arrow': (lambda frame: encode_request(frame, ARROW), ARROW),
+}
+
+
+async def call(app, body, media_type):
+    """POST body to /predict/batch straight through the ASGI app (no HTTP client or socket); returns the response body."""
+    scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'POST', 'scheme': 'http',
+             'path': '/predict/batch', 'raw_path': b'/predict/batch', 'root_path': '', 'query_string': b'',
+             'headers': [(b'content-type', media_type.encode()), (b'accept', media_type.encode()),
+                         (b'content-length', str(len(body)).encode())],
+             'client': ('127.0.0.1', 0), 'server': ('127.0.0.1', 80)}
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    chunks = []
+    status = []
+
+    async def receive():
+        return messages.pop() if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+        elif message['type'] == 'http.response.body':
+            chunks.append(message.get('body', b''))
+
+    await app(scope, receive, send)
+    if status != [200]:
+        raise RuntimeError(f"/predict/batch returned {status}: {b''.join(chunks)[:200]!r}")
+    return b''.join(chunks)
+
+
+async def run(args, frame):
+    app = prediction_FastAPI.app
+    results = {}
+    async with prediction_FastAPI.lifespan(app):
+        for name in args.formats:
+            build, media_type = FORMATS[name]
+            body = build(frame)
+            response = await call(app, body, media_type)
+            predictions = decode_predictions(response, media_type)
+            # CPU of the whole process: decoding, validation, encoding, scoring and serialization
+            timings = []
+            for _ in range(args.repeat):
+                start = time.process_time()
+                await call(app, body, media_type)
+                timings.append(time.process_time() - start)
+            results[name] = (len(body), len(response), min(timings), predictions)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Payload size and server CPU of /predict/batch per wire format.")
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--data', default='bank_marketing_data.csv', help="CSV whose distributions the rows follow")
+    parser.add_argument('--formats', nargs='+', choices=list(FORMATS), default=list(FORMATS))
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    warnings.filterwarnings('ignore', message='X does not have valid feature names')
+    frame = pd.DataFrame(synthetic_rows(args.data, args.rows))
+    results = asyncio.run(run(args, frame))
+
+    reference = next(iter(results.values()))[3]
+    print(f"{'format':>13} {'request KB':>11} {'response KB':>12} {'server CPU ms':>14} {'per 10k rows ms':>16}")
+    for name, (request_size, response_size, cpu, predictions) in results.items():
+        # Every format must return the same predictions
+        assert predictions['prediction'].astype(str).tolist() == reference['prediction'].astype(str).tolist(), name
+        print(f"{name:>13} {request_size / 1024:>11,.0f} {response_size / 1024:>12,.0f} {cpu * 1000:>14,.1f} "
+              f"{cpu * 1000 * 10000 / args.rows:>16,.1f}")
@@ -0,0 +1,269 @@
+import argparse
+import copy
+import json
+import os
+import pickle
+import sys
+import time
+import warnings
+
+import joblib
+import numpy as np
+from sklearn.ensemble import BaggingClassifier
+from sklearn.metrics import f1_score
+from sklearn.model_selection import train_test_split
+from sklearn.tree import DecisionTreeClassifier
+
+from benchmark import measure
+from compiled_model import CompiledForest
+from feature_encoder import FeatureEncoder
+from model_bundle import ModelBundle
+from ranking import POSITIVE_CLASS
+from train import DEFAULT_CONFIG, atomic_write, clean, split
+
+ARTIFACTS = ['mappings.pkl', 'standard_scaler.pkl', 'job_train_unique.pkl', 'education_train_unique.pkl',
+             'marital_train_unique.pkl', 'month_train_unique.pkl', 'dow_train_unique.pkl']
+
+# Latency is timed on batches of this many validation rows, at least MIN_TIMING_REPEATS times
+# whatever --budget is; the fastest batch gives the per-row latency
+DEFAULT_TIMING_ROWS = 256
+MIN_TIMING_REPEATS = 20
+
+# Distilled students: (number of trees, max depth)
+DISTILL_SHAPES = [(1, 4), (1, 6), (1, 8), (1, 10), (3, 6), (3, 8), (5, 6), (5, 8), (10, 8)]
+
+
+def truncate_tree(estimator, depth):
+    """Copy of a fitted DecisionTreeClassifier whose nodes below `depth` are cut off.
+
+    sklearn keeps the class counts of every internal node, so a cut node becomes a
+    leaf predicting from the samples that reached it. Kept nodes are renumbered in
+    the original depth-first order.
+    """
+    state = estimator.tree_.__getstate__()
+    nodes, values = state['nodes'], state['values']
+    order, cut, depths = [], [], []
+    stack = [(0, 0)]
+    while stack:
+        node, node_depth = stack.pop()
+        order.append(node)
+        depths.append(node_depth)
+        leaf = nodes['left_child'][node] == -1 or node_depth >= depth
+        cut.append(leaf)
+        if not leaf:
+            stack.append((nodes['right_child'][node], node_depth + 1))
+            stack.append((nodes['left_child'][node], node_depth + 1))
+
+    order, cut = np.array(order), np.array(cut)
+    position = np.zeros(len(nodes), dtype=np.intp)
+    position[order] = np.arange(len(order))
+    truncated_nodes = nodes[order].copy()
+    truncated_nodes['left_child'] = np.where(cut, -1, position[truncated_nodes['left_child']])
+    truncated_nodes['right_child'] = np.where(cut, -1, position[truncated_nodes['right_child']])
+    truncated_nodes['feature'][cut] = -2
+    truncated_nodes['threshold'][cut] = -2.0
+
+    truncated = copy.deepcopy(estimator)
+    truncated.set_params(max_depth=depth)
+    truncated.tree_.__setstate__({'max_depth': max(depths), 'node_count': len(order),
+                                  'nodes': truncated_nodes, 'values': values[order].copy()})
+    return truncated
+
+
+def sub_ensemble(model, indices, estimators=None):
+    """The BaggingClassifier restricted to the estimators at `indices` (of `estimators`, default its own)."""
+    estimators = model.estimators_ if estimators is None else estimators
+    pruned = copy.copy(model)
+    pruned.estimators_ = [estimators[i] for i in indices]
+    pruned.estimators_features_ = [model.estimators_features_[i] for i in indices]
+    pruned._seeds = model._seeds[list(indices)]
+    pruned.n_estimators = len(indices)
+    return pruned
+
+
+def greedy_order(estimator_proba, y):
+    """Estimator indices in the order forward selection adds them, each step maximizing the ensemble's F1.
+
+    `estimator_proba` is (estimators, rows, classes); a subset predicts "yes" where its summed
+    "yes" probability beats the "no" one, as BaggingClassifier.predict does.
+    """
+    positive = y == POSITIVE_CLASS
+    remaining = list(range(len(estimator_proba)))
+    chosen = []
+    total = np.zeros(estimator_proba.shape[1:])
+    while remaining:
+        scores = [f1_score(positive, (total + estimator_proba[i])[:, 1] > (total + estimator_proba[i])[:, 0])
+                  for i in remaining]
+        best = remaining.pop(int(np.argmax(scores)))
+        chosen.append(best)
+        total += estimator_proba[best]
+    return chosen
+
+
+def distill(model, x_train, n_trees, depth, seed):
+    """Smaller bagging ensemble trained to reproduce the model's own predictions on the training rows."""
+    student = BaggingClassifier(estimator=DecisionTreeClassifier(max_depth=depth, random_state=seed),
+                                n_estimators=n_trees, bootstrap=n_trees > 1, random_state=seed)
+    return student.fit(x_train, model.predict(x_train))
+
+
+def candidates(model, x_train, y_train, seed):
+    """Yield (name, model) for every pruned, truncated and distilled variant of `model`.
+
+    The pruning order is picked on the training rows, so the validation rows stay
+    unseen until the candidates are scored.
+    """
+    max_depth = max(estimator.tree_.max_depth for estimator in model.estimators_)
+    for depth in range(max_depth, 1, -1):
+        estimators = [truncate_tree(estimator, depth) for estimator in model.estimators_]
+        estimator_proba = np.stack([estimator.predict_proba(x_train.to_numpy()[:, features])
+                                    for estimator, features in zip(estimators, model.estimators_features_)])
+        order = greedy_order(estimator_proba, y_train)
+        for n_estimators in range(1, len(order) + 1):
+            yield f"prune depth={depth} trees={n_estimators}", sub_ensemble(model, order[:n_estimators], estimators)
+    for n_trees, depth in DISTILL_SHAPES:
+        yield f"distill depth={depth} trees={n_trees}", distill(model, x_train, n_trees, depth, seed)
+
+
+def evaluate(name, candidate, x_valid, y_valid, engine, budget, timing_rows=DEFAULT_TIMING_ROWS):
+    """F1 of "yes" on the validation rows, per-row latency on `engine` and pickled size.
+
+    The latency is timed on a batch of `timing_rows` validation rows, so the model's own work
+    outweighs the fixed cost of a call, and is the fastest of the repeated timings (noise only
+    ever adds time) divided by the batch size.
+    """
+    rows = x_valid.iloc[:timing_rows]
+    if engine == 'compiled':
+        compiled = CompiledForest.from_sklearn(candidate)
+        rows = rows.to_numpy()
+        timings = measure(lambda: compiled.predict_proba(rows), budget, min_repeats=MIN_TIMING_REPEATS)
+    else:
+        timings = measure(lambda: candidate.predict_proba(rows), budget, min_repeats=MIN_TIMING_REPEATS)
+    return {'name': name, 'n_estimators': len(candidate.estimators_),
+            'max_depth': max(estimator.tree_.max_depth for estimator in candidate.estimators_),
+            'nodes': sum(estimator.tree_.node_count for estimator in candidate.estimators_),
+            'f1': f1_score(y_valid, candidate.predict(x_valid), pos_label=POSITIVE_CLASS),
+            'latency_ms': float(timings.min()) * 1000 / len(rows), 'bytes': len(pickle.dumps(candidate))}
+
+
+def pareto_frontier(results):
+    """Results no other result beats on both latency and F1, fastest first."""
+    frontier = []
+    for result in sorted(results, key=lambda r: (r['latency_ms'], -r['f1'])):
+        if not frontier or result['f1'] > frontier[-1]['f1']:
+            frontier.append(result)
+    return frontier
+
+
+def choose(results, baseline, tolerance, max_latency_ms=None, max_bytes=None, confirm=None):
+    """The fastest result within `tolerance` of the baseline F1 and the budgets, or None.
+
+    With `confirm`, eligible results are tried fastest first and the first one it accepts is
+    chosen, so a result that only looks good on the validation rows falls through to the next.
+    """
+    eligible = [r for r in results if r['f1'] >= baseline['f1'] - tolerance
+                and (max_latency_ms is None or r['latency_ms'] <= max_latency_ms)
+                and (max_bytes is None or r['bytes'] <= max_bytes)]
+    for result in sorted(eligible, key=lambda r: (r['latency_ms'], r['bytes'])):
+        if confirm is None or confirm(result):
+            return result
+    return None
+
+
+def load_split(data_path, encoder, seed):
+    """Encoded training rows, and the held-out rows of train.py's split halved into validation and test."""
+    x_train, x_holdout, y_train, y_holdout = split(data_path, DEFAULT_CONFIG)
+    x_train, x_holdout, _ = clean(x_train, x_holdout)
+    x_valid, x_test, y_valid, y_test = train_test_split(x_holdout, y_holdout, test_size=0.5, random_state=seed,
+                                                        stratify=y_holdout)
+
+    def encode(frame):
+        return encoder.to_frame(encoder.encode_frame(frame))
+
+    return (encode(x_train), y_train.to_numpy(), encode(x_valid), y_valid.to_numpy(),
+            encode(x_test), y_test.to_numpy())
+
+
+def compress(model_path='Bagging_dt.pkl', data_path='bank_marketing_data.csv', artifacts_dir='.', tolerance=0.01,
+             max_latency_ms=None, max_bytes=None, engine='compiled', budget=0.1, timing_rows=DEFAULT_TIMING_ROWS, seed=0,
+             report=sys.stderr):
+    warnings.filterwarnings('ignore', message='X does not have valid feature names')
+    model = joblib.load(model_path)
+    pickles = [joblib.load(os.path.join(artifacts_dir, name)) for name in ARTIFACTS]
+    encoder = FeatureEncoder.from_artifacts(model, *pickles)
+    x_train, y_train, x_valid, y_valid, x_test, y_test = load_split(data_path, encoder, seed)
+
+    baseline = evaluate('original', model, x_valid, y_valid, engine, budget, timing_rows)
+    print(f"original: {baseline['n_estimators']} trees, F1 {baseline['f1']:.4f}, "
+          f"{baseline['latency_ms']:.5f} ms/row, {baseline['bytes']:,} bytes", file=report)
+    results, models = [], {}
+    start = time.perf_counter()
+    for name, candidate in candidates(model, x_train, y_train, seed):
+        results.append(evaluate(name, candidate, x_valid, y_valid, engine, budget, timing_rows))
+        models[name] = candidate
+    print(f"Evaluated {len(results)} candidates in {time.perf_counter() - start:.1f} s", file=report)
+
+    frontier = pareto_frontier(results + [baseline])
+    print(f"{'candidate':<28} {'trees':>5} {'depth':>5} {'F1':>7} {'ms/row':>9} {'bytes':>9}", file=report)
+    for r in frontier:
+        print(f"{r['name']:<28} {r['n_estimators']:>5} {r['max_depth']:>5} {r['f1']:>7.4f} "
+              f"{r['latency_ms']:>9.5f} {r['bytes']:>9,}", file=report)
+
+    # A candidate picked on the validation half must also hold its F1 on the test half,
+    # otherwise the next fastest one is tried
+    test_f1 = {'original': f1_score(y_test, model.predict(x_test), pos_label=POSITIVE_CLASS)}
+    rejected = []
+
+    def confirm(result):
+        result['test_f1'] = f1_score(y_test, models[result['name']].predict(x_test), pos_label=POSITIVE_CLASS)
+        if result['test_f1'] >= test_f1['original'] - tolerance:
+            return True
+        rejected.append(result['name'])
+        return False
+
+    chosen = choose(results, baseline, tolerance, max_latency_ms, max_bytes, confirm)
+    if rejected:
+        print(f"Rejected {len(rejected)} candidate(s) whose test F1 dropped more than {tolerance} "
+              f"below the original's {test_f1['original']:.4f}: {', '.join(rejected)}", file=report)
+    summary = {'engine': engine, 'timing_rows': timing_rows, 'tolerance': tolerance, 'max_latency_ms': max_latency_ms, 'max_bytes': max_bytes,
+               'baseline': baseline, 'chosen': chosen, 'rejected_on_test': rejected, 'test_f1': test_f1,
+               'frontier': frontier, 'candidates': results}
+    if chosen is not None:
+        test_f1['chosen'] = chosen['test_f1']
+        return models[chosen['name']], pickles, summary
+    return None, pickles, summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search for a smaller ensemble within an F1 tolerance and latency/size budgets.")
+    parser.add_argument('--model', default='Bagging_dt.pkl')
+    parser.add_argument('--data', default='bank_marketing_data.csv')
+    parser.add_argument('--artifacts', default='.', help="Directory with the encoder pickles")
+    parser.add_argument('--tolerance', type=float, default=0.01, help="Allowed drop of the F1 of 'yes', on both the validation and the test rows")
+    parser.add_argument('--max-latency-ms', type=float, default=None, help="Per-row latency budget")
+    parser.add_argument('--max-bytes', type=int, default=None, help="Pickled model size budget")
+    parser.add_argument('--engine', choices=['sklearn', 'compiled'], default='compiled',
+                        help="Scoring engine whose latency is measured ")
+    parser.add_argument('--budget', type=float, default=0.1, help="Approximate seconds spent timing each candidate")
+    parser.add_argument('--timing-rows', type=int, default=DEFAULT_TIMING_ROWS,
+                        help="Rows per timed call (1 times single-row calls, mostly per-call overhead)")
+    parser.add_argument('--output', default='Bagging_dt_compressed.pkl', help="Drop-in replacement for Bagging_dt.pkl")
+    parser.add_argument('--bundle', default=None, help="Also write a model bundle with the compressed model")
+    parser.add_argument('--report', default='compression_report.json')
+    args = parser.parse_args()
+
+    compressed, pickles, summary = compress(args.model, args.data, args.artifacts, args.tolerance, args.max_latency_ms,
+                                            args.max_bytes, args.engine, args.budget, args.timing_rows)
+    with open(args.report, 'w') as f:
+        json.dump(summary, f, indent=2)
+    if compressed is None:
+        raise SystemExit("No candidate meets the F1 tolerance on validation and test rows and the budgets; see " + args.report)
+
+    chosen = summary['chosen']
+    atomic_write(args.output, lambda f: pickle.dump(compressed, f))
+    print(f"Chose {chosen['name']}: F1 {chosen['f1']:.4f} (test {summary['test_f1']['chosen']:.4f}, "
+          f"original {summary['test_f1']['original']:.4f}), {chosen['latency_ms']:.5f} ms/row, "
+          f"{chosen['bytes']:,} bytes; written to {args.output}", file=sys.stderr)
+    if args.bundle:
+        bundle = ModelBundle.from_artifacts(compressed, *pickles)
+        bundle.save(args.bundle)
+        print(f"Wrote {args.bundle} (version {bundle.version})", file=sys.stderr)
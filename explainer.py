@@ -0,0 +1,74 @@
+import numpy as np
+
+from compiled_model import CompiledForest
+from feature_encoder import INPUT_COLUMNS, ONE_HOT_FIELDS
+
+
+def field_of(feature_name):
+    """Raw input field a model column is derived from, e.g. 'job_admin' -> 'job', 'contact_status' -> 'pdays'."""
+    for field, _ in ONE_HOT_FIELDS:
+        if feature_name.startswith(f"{field}_"):
+            return field
+    if feature_name == 'contact_status':
+        return 'pdays'
+    return feature_name
+
+
+class TreePathExplainer:
+    """Splits the ensemble's probability of one class into a bias plus one contribution per input field.
+
+    In every tree, each node's probability minus its parent's is credited to the feature the parent
+    splits on; along a decision path these deltas add up to leaf value - root value. The sums are
+    precomputed once for every node, already aggregated to the raw fields, so explaining a batch
+    is the leaf lookup of a prediction plus one gather per estimator.
+    """
+
+    def __init__(self, forest, positive_class='yes'):
+        self.forest = forest
+        self.positive_index = list(forest.classes_).index(positive_class)
+        self.fields = [field for field in INPUT_COLUMNS if field in {field_of(name) for name in forest.feature_names_in_}]
+        field_index = np.array([self.fields.index(field_of(name)) for name in forest.feature_names_in_], dtype=np.intp)
+
+        value = forest.leaf_proba[:, self.positive_index]
+        self.bias = float(value[forest.roots].mean())
+        # path[node, field]: summed deltas from the tree's root down to `node`
+        self.path = np.zeros((len(value), len(self.fields)))
+        frontier = forest.roots
+        while len(frontier):
+            internal = frontier[forest.left[frontier] != frontier]
+            split_field = field_index[forest.feature[internal]]
+            for children in (forest.left[internal], forest.right[internal]):
+                self.path[children] = self.path[internal]
+                self.path[children, split_field] += value[children] - value[internal]
+            frontier = np.concatenate([forest.left[internal], forest.right[internal]])
+
+    @classmethod
+    def from_model(cls, model, positive_class='yes'):
+        """Explainer for a CompiledForest, or for a BaggingClassifier (compiled first)."""
+        forest = model if isinstance(model, CompiledForest) else CompiledForest.from_sklearn(model)
+        return cls(forest, positive_class)
+
+    def explain(self, X):
+        """(probabilities, contributions) for a feature matrix.
+
+        `probabilities` is exactly the forest's predict_proba; `contributions` has one column per
+        entry of `fields`, and bias + its row sums equal the positive-class probability up to rounding.
+        """
+        leaves = self.forest.apply(X)
+        n_estimators = self.forest.n_estimators
+        proba = np.zeros((leaves.shape[0], len(self.forest.classes_)))
+        contributions = np.zeros((leaves.shape[0], len(self.fields)))
+        # Accumulate estimator by estimator, as predict_proba does, so memory stays (rows, fields)
+        for estimator in range(n_estimators):
+            proba += self.forest.leaf_proba[leaves[:, estimator]]
+            contributions += self.path[leaves[:, estimator]]
+        return proba / n_estimators, contributions / n_estimators
+
+    def explain_records(self, X):
+        """Per-row dicts: the predicted class, its positive-class probability, the bias and field contributions."""
+        proba, contributions = self.explain(X)
+        labels = self.forest.classes_.take(np.argmax(proba, axis=1), axis=0)
+        return [{"prediction": label, "probability": probability, "bias": self.bias,
+                 "contributions": dict(zip(self.fields, row))}
+                for label, probability, row in zip(labels.tolist(), proba[:, self.positive_index].tolist(),
+                                                   contributions.tolist())]
@@ -0,0 +1,128 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+# Raw input fields, in the order of the Data model / bank_marketing_data.csv
+INPUT_COLUMNS = ['age', 'job', 'marital', 'education', 'default', 'housing', 'loan', 'contact',
+                 'month', 'day_of_week', 'duration', 'campaign', 'pdays', 'previous', 'poutcome']
+
+# One-hot encoded fields and whether unseen values go to a '<field>_other' column (as in modelling.ipynb)
+ONE_HOT_FIELDS = [('job', True), ('marital', False), ('education', True), ('month', True), ('day_of_week', False)]
+
+NUM_COLS = ['age', 'duration', 'campaign', 'previous']
+
+# Below this many rows a plain dict lookup is cheaper than a pandas hash lookup
+SMALL_BATCH = 32
+
+
+class FeatureEncoder:
+    """Turns raw customer records into the model's feature matrix.
+
+    All lookup tables (category -> column index, ordinal codes, scaler mean/scale)
+    are built once, so encoding is a handful of NumPy writes into a preallocated
+    matrix whose columns follow `feature_names` (the model's `feature_names_in_`).
+    """
+
+    def __init__(self, feature_names, vocabularies, categorical_mappings, scaler_mean, scaler_scale, num_cols=NUM_COLS):
+        self.feature_names = np.asarray(feature_names, dtype=object)
+        column_index = {name: i for i, name in enumerate(self.feature_names)}
+
+        # field -> (category -> column index, '_other' column index or -1, hash index over the categories, their column indices)
+        self.one_hot = {}
+        for field, has_other in ONE_HOT_FIELDS:
+            table = {value: column_index[f"{field}_{value}"] for value in vocabularies[field]
+                     if f"{field}_{value}" in column_index}
+            other = column_index.get(f"{field}_other", -1) if has_other else -1
+            self.one_hot[field] = (table, other, pd.Index(list(table)), np.fromiter(table.values(), np.intp, len(table)))
+
+        # field -> (value -> ordinal code, column index, hash index over the values, their codes)
+        self.ordinal = {field: (mapping, column_index[field], pd.Index(list(mapping)),
+                                np.fromiter(mapping.values(), np.float64, len(mapping)))
+                        for field, mapping in categorical_mappings.items() if field in column_index}
+
+        self.num_index = np.array([column_index[col] for col in num_cols], dtype=np.intp)
+        self.num_cols = list(num_cols)
+        self.scaler_mean = np.asarray(scaler_mean, dtype=np.float64)
+        self.scaler_scale = np.asarray(scaler_scale, dtype=np.float64)
+        self.contact_status_index = column_index['contact_status']
+
+    @classmethod
+    def from_artifacts(cls, model, mappings, scaler, job_train_unique, education_train_unique,
+                       marital_train_unique, month_train_unique, dow_train_unique):
+        vocabularies = {'job': job_train_unique, 'marital': marital_train_unique, 'education': education_train_unique,
+                        'month': month_train_unique, 'day_of_week': dow_train_unique}
+        return cls(model.feature_names_in_, vocabularies, mappings['categorical_mappings'],
+                   scaler.mean_, scaler.scale_, num_cols=list(scaler.feature_names_in_))
+
+    @property
+    def n_features(self):
+        return len(self.feature_names)
+
+    def encode_records(self, records, dtype=np.float64, out=None, timings=None):
+        """Encode a list of dicts (e.g. `Data.model_dump()` or `validate_rows` results)."""
+        return self.encode_columns({col: [record[col] for record in records] for col in INPUT_COLUMNS},
+                                   len(records), dtype=dtype, out=out, timings=timings)
+
+    def encode_frame(self, frame, dtype=np.float64, out=None, timings=None):
+        """Encode a DataFrame with the raw input columns."""
+        return self.encode_columns({col: frame[col].to_numpy() for col in INPUT_COLUMNS}, len(frame),
+                                   dtype=dtype, out=out, timings=timings)
+
+    def encode_columns(self, columns, n_rows, dtype=np.float64, out=None, timings=None):
+        """Encode a mapping of column name -> sequence of n_rows values.
+
+        `out`, if given, must be a zeroed (n_rows, n_features) array; it is filled in place.
+        `timings`, if given, is a dict that receives the seconds spent in the 'one_hot',
+        'mapping' and 'scaling' steps.
+        Raises ValueError for values that have no ordinal code (e.g. default='maybe').
+        """
+        start = time.perf_counter()
+        if out is None:
+            out = np.zeros((n_rows, self.n_features), dtype=dtype)
+        rows = np.arange(n_rows)
+
+        for field, (table, other, index, targets) in self.one_hot.items():
+            target = self._lookup(columns[field], table, index, targets, -1, np.intp)
+            if other >= 0:
+                target[target < 0] = other
+            hit = target >= 0
+            out[rows[hit], target[hit]] = 1
+        one_hot_done = time.perf_counter()
+
+        for field, (mapping, column, index, codes) in self.ordinal.items():
+            code = self._lookup(columns[field], mapping, index, codes, np.nan, np.float64)
+            if np.isnan(code).any():
+                values = np.asarray(columns[field], dtype=object)
+                raise ValueError(f"Unknown value {values[np.isnan(code)][0]!r} for '{field}'")
+            out[:, column] = code
+
+        pdays = np.asarray(columns['pdays'])
+        out[:, self.contact_status_index] = pdays != 999
+        mapping_done = time.perf_counter()
+
+        # Same arithmetic as StandardScaler.transform, done in float64 before casting to `dtype`
+        numeric = np.column_stack([np.asarray(columns[col], dtype=np.float64) for col in self.num_cols])
+        numeric -= self.scaler_mean
+        numeric /= self.scaler_scale
+        out[:, self.num_index] = numeric
+
+        if timings is not None:
+            timings['one_hot'] = one_hot_done - start
+            timings['mapping'] = mapping_done - one_hot_done
+            timings['scaling'] = time.perf_counter() - mapping_done
+        return out
+
+    def to_frame(self, features):
+        """Wrap an encoded matrix with the model's column names, for estimators fitted on a DataFrame."""
+        return pd.DataFrame(features, columns=self.feature_names, copy=False)
+
+    @staticmethod
+    def _lookup(values, table, index, targets, missing, dtype):
+        if len(values) <= SMALL_BATCH:
+            return np.fromiter((table.get(value, missing) for value in values), dtype, len(values))
+        position = index.get_indexer(values)
+        result = np.full(len(position), missing, dtype=dtype)
+        found = position >= 0
+        result[found] = targets[position[found]]
+        return result
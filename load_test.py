@@ -0,0 +1,94 @@
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+import numpy as np
+import pandas as pd
+
+from feature_encoder import INPUT_COLUMNS
+
+
+def sample_payloads(csv_path, n):
+    """Valid /predict/ payloads drawn from bank_marketing_data.csv."""
+    data = pd.read_csv(csv_path, usecols=INPUT_COLUMNS).dropna()
+    data['job'] = data['job'].str.replace('.', '')
+    data['duration'] = data['duration'].astype(int)
+    return data.sample(n=n, replace=True, random_state=0).to_dict('records')
+
+
+async def run(url, payloads, concurrency):
+    latencies = []
+    failures = 0
+    queue = asyncio.Queue()
+    for payload in payloads:
+        queue.put_nowait(payload)
+
+    async def client_loop(client):
+        nonlocal failures
+        while not queue.empty():
+            payload = queue.get_nowait()
+            start = time.perf_counter()
+            response = await client.post(f"{url}/predict/", json=payload)
+            latencies.append(time.perf_counter() - start)
+            failures += response.status_code != 200
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return np.array(latencies), failures, elapsed
+
+
+def wait_until_up(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            httpx.get(url)
+            return
+        except httpx.TransportError:
+            time.sleep(0.2)
+    raise SystemExit(f"Server at {url} did not start")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent load test of /predict/ against a local uvicorn server.")
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--data', default='bank_marketing_data.csv')
+    parser.add_argument('--spawn', action='store_true',
+                        help="Start uvicorn for prediction_FastAPI:app on --url's port (env such as MICRO_BATCH_SIZE is passed through)")
+    parser.add_argument('--cache', action='store_true',
+                        help="Keep the prediction cache of the spawned server on (payloads repeat, so most requests become hits)")
+    args = parser.parse_args()
+
+    server = None
+    if args.spawn:
+        port = httpx.URL(args.url).port or 8000
+        env = os.environ.copy()
+        if not args.cache:
+            env['PREDICTION_CACHE_SIZE'] = '0'
+        server = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'prediction_FastAPI:app', '--port', str(port),
+                                   '--log-level', 'warning'], env=env)
+    try:
+        wait_until_up(args.url)
+        if httpx.get(f"{args.url}/stats/cache").json().get('enabled'):
+            print("Warning: the server's prediction cache is on; repeated payloads are served from it", file=sys.stderr)
+        latencies, failures, elapsed = asyncio.run(run(args.url, sample_payloads(args.data, args.requests),
+                                                       args.concurrency))
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+        print(f"{len(latencies)} requests, concurrency {args.concurrency}, {failures} failed")
+        print(f"{len(latencies) / elapsed:,.0f} requests/s, latency p50 {p50:.1f} ms, p95 {p95:.1f} ms, p99 {p99:.1f} ms")
+        stats = httpx.get(f"{args.url}/stats/batcher").json()
+        if stats.get('enabled'):
+            print(f"micro-batcher: mean batch size {stats['mean_batch_size']:.1f}, "
+                  f"max queue depth {stats['max_queue_depth']}")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
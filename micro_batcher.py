@@ -0,0 +1,93 @@
+import asyncio
+import collections
+
+
+class MicroBatcher:
+    """Coalesces concurrent single-row predictions into one vectorized model call.
+
+    `submit` queues an item and waits for its result. A background task takes
+    the first waiting item, keeps collecting until `max_batch_size` items or
+    `max_wait` seconds have passed, and hands the whole batch to `predict_fn`
+    (a sync function from a list of items to a list of results) in a thread,
+    so the event loop keeps accepting requests while the model runs.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=64, max_wait=0.002):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue = None
+        self.task = None
+        self.batches = 0
+        self.items = 0
+        self.max_queue_depth = 0
+        self.batch_size_counts = collections.Counter()
+
+    async def start(self):
+        self.queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        while self.queue is not None and not self.queue.empty():
+            _, future = self.queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Prediction service is shutting down"))
+
+    async def submit(self, item):
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((item, future))
+        self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            items = [item for item, _ in batch]
+            try:
+                results = await loop.run_in_executor(None, self.predict_fn, items)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for (_, future), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+            self.batches += 1
+            self.items += len(batch)
+            self.batch_size_counts[len(batch)] += 1
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue.qsize() if self.queue is not None else 0,
+            "max_queue_depth": self.max_queue_depth,
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "batch_size_counts": dict(sorted(self.batch_size_counts.items())),
+        }
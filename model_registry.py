@@ -0,0 +1,374 @@
+import collections
+import functools
+import hashlib
+import io
+import os
+import queue
+import random
+import threading
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from compiled_model import CompiledForest
+from explainer import TreePathExplainer
+from feature_encoder import INPUT_COLUMNS, FeatureEncoder
+from model_bundle import ModelBundle, artifact_version, check_manifest, manifest_path
+from ranking import POSITIVE_CLASS
+from schemas import validate_rows
+
+# Encoder artifacts loaded next to a pickled or compiled model (the bundle carries its own)
+ENCODER_ARTIFACTS = ['mappings.pkl', 'standard_scaler.pkl', 'job_train_unique.pkl', 'education_train_unique.pkl',
+                     'marital_train_unique.pkl', 'month_train_unique.pkl', 'dow_train_unique.pkl']
+
+# Used as the smoke batch when no CSV of customers is available
+SMOKE_RECORDS = [
+    {'age': 83, 'job': 'retired', 'marital': 'divorced', 'education': 'basic.4y', 'default': 'no', 'housing': 'no',
+     'loan': 'no', 'contact': 'cellular', 'month': 'nov', 'day_of_week': 'tue', 'duration': 242, 'campaign': 1,
+     'pdays': 3, 'previous': 3, 'poutcome': 'success'},
+    {'age': 32, 'job': 'services', 'marital': 'married', 'education': 'high.school', 'default': 'no', 'housing': 'no',
+     'loan': 'no', 'contact': 'telephone', 'month': 'may', 'day_of_week': 'tue', 'duration': 190, 'campaign': 3,
+     'pdays': 999, 'previous': 0, 'poutcome': 'nonexistent'},
+]
+
+
+class ModelRejected(ValueError):
+    pass
+
+
+class ModelVersion:
+    """One loaded model version: model, encoder and version label, never modified once built.
+
+    Requests take the registry's current version once and use it to the end, so a swap
+    never changes the model or encoder under a request that is already running.
+    """
+
+    def __init__(self, model, encoder, version, source, checksum=None):
+        self.model = model
+        self.encoder = encoder
+        self.version = version
+        self.source = source
+        # Content checksum when loaded from a model bundle
+        self.checksum = checksum
+        self.positive_index = list(model.classes_).index(POSITIVE_CLASS)
+        self.loaded_at = time.time()
+
+    @property
+    def fingerprint(self):
+        """What identifies the contents: the bundle checksum (its version label can be reused), else the digest in `version`."""
+        return self.checksum or self.version
+
+    @functools.cached_property
+    def explainer(self):
+        return TreePathExplainer.from_model(self.model, POSITIVE_CLASS)
+
+    def predict_proba(self, features):
+        return self.model.predict_proba(self.align(features))
+
+    def align(self, features):
+        # The sklearn model wants its column names; the compiled one takes the plain matrix
+        return features if isinstance(self.model, CompiledForest) else self.encoder.to_frame(features)
+
+    def score(self, features, timings=None, pool=None):
+        """Labels and "yes" probabilities for an encoded feature matrix, the one implementation the live
+        and shadow paths share.
+
+        `pool`, a ParallelPredictor holding this version, scores the matrix in its workers instead.
+        `timings`, if given, receives the seconds spent in the 'alignment' and 'predict' steps.
+        """
+        start = time.perf_counter()
+        aligned, scorer = (features, pool) if pool is not None else (self.align(features), self.model)
+        aligned_at = time.perf_counter()
+        proba = scorer.predict_proba(aligned)
+        # Same decision as model.predict: the class with the highest averaged probability
+        labels = self.model.classes_.take(np.argmax(proba, axis=1), axis=0)
+        if timings is not None:
+            timings['alignment'] = aligned_at - start
+            timings['predict'] = time.perf_counter() - aligned_at
+        return labels, proba[:, self.positive_index]
+
+    def info(self):
+        return {"version": self.version, "source": self.source,
+                "loaded_at": time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.loaded_at))}
+
+
+def watched_paths(source, artifacts_dir='.'):
+    """Files whose change means a new version of `source`: the bundle alone, or the model plus the encoder pickles."""
+    if source.endswith(('.pkl', '.npz')):
+        return [source] + [os.path.join(artifacts_dir, name) for name in ENCODER_ARTIFACTS]
+    return [source]
+
+
+def load_version(source, artifacts_dir='.'):
+    """ModelVersion for a model bundle, a compiled .npz or a pickled BaggingClassifier (with the encoder pickles)."""
+    if not source.endswith(('.pkl', '.npz')):
+        # A fresh mapping on every load: the bundle's lru_cache would keep returning the file as first opened
+        bundle = ModelBundle.open(source)
+        return ModelVersion(bundle.model, bundle.encoder, bundle.version, source, bundle.checksum)
+    # Separate files can be caught mid-deploy. Each one is read once, and the manifest check and the
+    # unpickling use those same bytes, so a set is rejected if what was loaded does not match its manifest
+    paths = watched_paths(source, artifacts_dir)
+    contents = {}
+    for path in paths:
+        with open(path, 'rb') as f:
+            contents[path] = f.read()
+    check_manifest(paths, {path: hashlib.sha256(data).hexdigest() for path, data in contents.items()})
+    model = (CompiledForest.load(io.BytesIO(contents[source])) if source.endswith('.npz')
+             else joblib.load(io.BytesIO(contents[source])))
+    pickles = [joblib.load(io.BytesIO(contents[path])) for path in paths[1:]]
+    encoder = FeatureEncoder.from_artifacts(model, *pickles)
+    return ModelVersion(model, encoder, artifact_version(paths, contents), source)
+
+
+def load_smoke_records(csv_path=None, n_rows=256):
+    """Validated records for the smoke check: the first valid rows of csv_path, or SMOKE_RECORDS."""
+    if csv_path is None or not os.path.exists(csv_path):
+        return validate_rows(SMOKE_RECORDS)[1]
+    data = pd.read_csv(csv_path, nrows=n_rows, usecols=INPUT_COLUMNS)
+    return validate_rows(data.astype(object).where(data.notna(), None).to_dict('records'))[1]
+
+
+def smoke_check(candidate, records, reference=None, min_agreement=None):
+    """Score `records` on the candidate, which warms it up, and raise ModelRejected if the results look wrong.
+
+    Rejects a candidate that fails to encode or score, returns probabilities outside [0, 1]
+    or not summing to 1, or agrees with the `reference` version's labels on fewer than
+    `min_agreement` of the rows. Returns the smoke results.
+    """
+    start = time.perf_counter()
+    try:
+        features = candidate.encoder.encode_records(records)
+        proba = candidate.predict_proba(features)
+        # Also the single-row path and the explainer, so the first requests after the swap are not the slow ones
+        candidate.score(features[:1])
+        candidate.explainer
+    except Exception as e:
+        raise ModelRejected(f"Version {candidate.version} failed to score the smoke batch: {e}") from e
+    seconds = time.perf_counter() - start
+
+    if proba.shape != (len(records), len(candidate.model.classes_)):
+        raise ModelRejected(f"Version {candidate.version} returned probabilities of shape {proba.shape}")
+    if not np.all(np.isfinite(proba)) or proba.min() < 0 or proba.max() > 1 or not np.allclose(proba.sum(axis=1), 1):
+        raise ModelRejected(f"Version {candidate.version} returned invalid probabilities")
+    result = {"rows": len(records), "seconds": seconds}
+    if reference is not None:
+        agreement = float(np.mean(reference.score(reference.encoder.encode_records(records))[0]
+                                  == candidate.score(features)[0]))
+        result["agreement"] = agreement
+        if min_agreement is not None and agreement < min_agreement:
+            raise ModelRejected(f"Version {candidate.version} agrees with {reference.version} on {agreement:.1%} "
+                                f"of the smoke batch, below {min_agreement:.1%}")
+    return result
+
+
+class ShadowScorer:
+    """Scores a sampled fraction of live traffic on a candidate version, off the request path.
+
+    `offer` only draws the sample and queues the already validated records (a list of dicts, or
+    a mapping of field -> column) with the served labels; a daemon thread encodes and scores them on the candidate and records label agreement,
+    the largest probability difference and both latencies. When the bounded queue is full the
+    sample is dropped instead of waiting.
+    """
+
+    def __init__(self, candidate, sample_rate, max_queue=100, seed=None):
+        self.candidate = candidate
+        self.sample_rate = sample_rate
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.offered = 0
+        self.sampled = 0
+        self.dropped = 0
+        self.failed = 0
+        self.rows = 0
+        self.agreed = 0
+        self.max_probability_diff = 0.0
+        self.served_seconds = collections.deque(maxlen=1000)
+        self.candidate_seconds = collections.deque(maxlen=1000)
+        self.thread = threading.Thread(target=self._run, name='shadow-scorer', daemon=True)
+        self.thread.start()
+
+    def offer(self, records, labels, probabilities, served_seconds):
+        with self.lock:
+            self.offered += 1
+            if self.random.random() >= self.sample_rate:
+                return
+        try:
+            self.queue.put_nowait((records, labels, probabilities, served_seconds))
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            records, labels, probabilities, served_seconds = item
+            try:
+                features = (self.candidate.encoder.encode_columns(records, len(labels)) if isinstance(records, dict)
+                            else self.candidate.encoder.encode_records(records))
+                # Timed like the served side: the model call only
+                start = time.perf_counter()
+                candidate_labels, candidate_probabilities = self.candidate.score(features)
+                seconds = time.perf_counter() - start
+            except Exception:
+                with self.lock:
+                    self.failed += 1
+                continue
+            with self.lock:
+                self.sampled += 1
+                self.rows += len(labels)
+                self.agreed += int(np.count_nonzero(np.asarray(labels) == candidate_labels))
+                self.max_probability_diff = max(self.max_probability_diff, float(
+                    np.max(np.abs(np.asarray(probabilities) - candidate_probabilities))))
+                self.served_seconds.append(served_seconds)
+                self.candidate_seconds.append(seconds)
+
+    def stop(self):
+        """Stop the thread after the samples already queued; later offers are ignored."""
+        self.sample_rate = 0.0
+        self.queue.put(None)
+        self.thread.join()
+
+    def stats(self):
+        with self.lock:
+            served, shadow = list(self.served_seconds), list(self.candidate_seconds)
+            return {
+                "candidate": self.candidate.info(),
+                "sample_rate": self.sample_rate,
+                "offered": self.offered,
+                "sampled": self.sampled,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "queue_depth": self.queue.qsize(),
+                "rows": self.rows,
+                "agreement": self.agreed / self.rows if self.rows else None,
+                "max_probability_diff": self.max_probability_diff,
+                "served_p50_ms": float(np.median(served)) * 1000 if served else None,
+                "candidate_p50_ms": float(np.median(shadow)) * 1000 if shadow else None,
+                "served_p95_ms": float(np.percentile(served, 95)) * 1000 if served else None,
+                "candidate_p95_ms": float(np.percentile(shadow, 95)) * 1000 if shadow else None,
+            }
+
+
+class ModelRegistry:
+    """The version being served, plus loading, checking and swapping in new ones.
+
+    `current` is replaced by a single reference assignment once a new version has been
+    loaded, warmed and has passed the smoke check, so readers never see a half-built
+    version and need no lock. Loads are serialized and run in the caller's thread; the
+    API calls them from the threadpool or a background task, never on the event loop.
+    """
+
+    def __init__(self, source, artifacts_dir='.', smoke_records=None, min_agreement=None):
+        self.source = source
+        self.artifacts_dir = artifacts_dir
+        self.smoke_records = smoke_records if smoke_records is not None else validate_rows(SMOKE_RECORDS)[1]
+        self.min_agreement = min_agreement
+        self.load_lock = threading.Lock()
+        self.signature = self._signature(source)
+        self.current = load_version(source, artifacts_dir)
+        smoke_check(self.current, self.smoke_records)
+        self.shadow = None
+        self.swaps = 0
+        self.rejections = 0
+        self.last_error = None
+
+    def _signature(self, source):
+        """(mtime, size) of every watched file and of their manifests; None while a watched file is missing (e.g. mid-deploy).
+
+        The manifest is part of it so that a set rejected as a mix is retried once the manifest is replaced too.
+        """
+        paths = watched_paths(source, self.artifacts_dir)
+        try:
+            signature = [(os.stat(path).st_mtime_ns, os.stat(path).st_size) for path in paths]
+        except FileNotFoundError:
+            return None
+        for manifest in sorted({manifest_path(path) for path in paths}):
+            signature.append(os.stat(manifest).st_mtime_ns if os.path.exists(manifest) else None)
+        return signature
+
+    def prepare(self, source=None):
+        """Load, warm and smoke-check a version of `source` (default: the served source) without serving it."""
+        source = source or self.source
+        try:
+            candidate = load_version(source, self.artifacts_dir)
+        except Exception as e:
+            raise ModelRejected(f"Could not load {source}: {e}") from e
+        smoke_check(candidate, self.smoke_records, self.current, self.min_agreement)
+        return candidate
+
+    def activate(self, candidate):
+        """Serve `candidate` from now on; returns the version it replaced."""
+        previous, self.current = self.current, candidate
+        self.source = candidate.source
+        self.swaps += 1
+        return previous
+
+    def reload(self, source=None):
+        """Prepare `source` and swap it in. Raises ModelRejected, leaving the served version untouched."""
+        with self.load_lock:
+            signature = self._signature(source or self.source)
+            try:
+                candidate = self.prepare(source)
+            except ModelRejected as e:
+                self.rejections += 1
+                self.last_error = str(e)
+                raise
+            self.signature = signature
+            self.last_error = None
+            if candidate.fingerprint != self.current.fingerprint:
+                self.activate(candidate)
+            return self.current
+
+    def poll(self):
+        """Reload when the served source's files changed since the last load attempt; True if a new version was swapped in.
+
+        A file set that fails to load is remembered and not retried until it changes again.
+        """
+        signature = self._signature(self.source)
+        if signature is None or signature == self.signature:
+            return False
+        previous = self.current
+        try:
+            self.reload()
+        except ModelRejected:
+            self.signature = signature
+            return False
+        return self.current is not previous
+
+    def start_shadow(self, source, sample_rate, max_queue=100):
+        """Prepare `source` and shadow-score `sample_rate` of the traffic on it; replaces any running shadow."""
+        with self.load_lock:
+            candidate = self.prepare(source)
+        self.stop_shadow()
+        self.shadow = ShadowScorer(candidate, sample_rate, max_queue)
+        return self.shadow
+
+    def stop_shadow(self):
+        shadow, self.shadow = self.shadow, None
+        if shadow is not None:
+            shadow.stop()
+        return shadow
+
+    def promote_shadow(self):
+        """Serve the shadow candidate (already loaded and checked) and stop shadow scoring."""
+        shadow = self.stop_shadow()
+        if shadow is None:
+            raise ModelRejected("No shadow candidate to promote")
+        with self.load_lock:
+            self.activate(shadow.candidate)
+            self.signature = self._signature(self.source)
+        return self.current
+
+    def stats(self):
+        return {
+            "current": self.current.info(),
+            "swaps": self.swaps,
+            "rejections": self.rejections,
+            "last_error": self.last_error,
+            "shadow": self.shadow.stats() if self.shadow is not None else None,
+        }
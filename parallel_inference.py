@@ -0,0 +1,68 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from model_bundle import DEFAULT_BUNDLE_PATH, BundleError, load_bundle
+
+# Batches smaller than this are scored in the calling process; shipping them to workers costs more than it saves
+DEFAULT_MIN_PARALLEL_ROWS = 4096
+
+_worker_bundle_path = None
+
+
+def _init_worker(bundle_path, checksum=None):
+    # Each worker maps the same bundle file, so the model arrays live once in the page cache
+    global _worker_bundle_path
+    _worker_bundle_path = bundle_path
+    bundle = load_bundle(bundle_path)
+    # A file replaced since the pool started must not be scored as the model the parent holds
+    if checksum is not None and bundle.checksum != checksum:
+        raise BundleError(f"{bundle_path} changed since the pool started")
+
+
+def _predict_proba_slice(features):
+    return load_bundle(_worker_bundle_path).model.predict_proba(features)
+
+
+class ParallelPredictor:
+    """A persistent process pool that scores large batches across cores.
+
+    Workers load the memory-mapped model bundle once, at start-up, and refuse a file whose
+    checksum differs from the one the pool was started with. A batch is cut
+    into one contiguous slice of rows per worker and the slices' probabilities are
+    concatenated back in input order, so results are identical to a single-process call.
+    """
+
+    def __init__(self, bundle_path=DEFAULT_BUNDLE_PATH, workers=None, min_parallel_rows=DEFAULT_MIN_PARALLEL_ROWS):
+        self.bundle_path = bundle_path
+        self.workers = workers or os.cpu_count()
+        self.min_parallel_rows = min_parallel_rows
+        bundle = load_bundle(bundle_path)
+        self.model = bundle.model
+        self.checksum = bundle.checksum
+        self.classes_ = self.model.classes_
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                            initargs=(bundle_path, self.checksum))
+        # Start every worker now rather than on the first large request
+        list(self.executor.map(_init_worker, [bundle_path] * self.workers, [self.checksum] * self.workers))
+
+    def predict_proba(self, features):
+        features = np.asarray(features, dtype=np.float32)
+        if len(features) < self.min_parallel_rows or self.workers == 1:
+            return self.model.predict_proba(features)
+        slices = np.array_split(features, self.workers)
+        return np.concatenate(list(self.executor.map(_predict_proba_slice, slices)))
+
+    def predict(self, features):
+        return self.classes_.take(np.argmax(self.predict_proba(features), axis=1), axis=0)
+
+    def close(self):
+        """Let running batches finish, drop queued ones and stop the workers."""
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
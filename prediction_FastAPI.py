@@ -1,183 +1,620 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, Field, validator
-import joblib
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field, ValidationError, model_validator
+from typing import Any, Dict, List, Optional
+import asyncio
+import cProfile
+import hmac
+import json
+import os
+import time
+import uuid
 import numpy as np
-import pandas as pd
-import pickle
-
-app = FastAPI()
-
-model = joblib.load('Bagging_dt.pkl')
-mappings = joblib.load('mappings.pkl')
-scaler = joblib.load('standard_scaler.pkl')
-job_train_unique = joblib.load('job_train_unique.pkl')
-education_train_unique = joblib.load('education_train_unique.pkl')
-marital_train_unique = joblib.load('marital_train_unique.pkl')
-month_train_unique = joblib.load('month_train_unique.pkl')
-dow_train_unique = joblib.load('dow_train_unique.pkl')
-
-
-class Data(BaseModel):
-    age: int = Field(..., gt=16, le=100, description="Age must be between 17 and 100")
-    job: str = Field(..., description="Job must be a string")
-    marital: str = Field(..., description="Marital status must be a string") 
-    education: str = Field(..., description="Education must be a string")
-    default: str = Field(..., description="Default must be 'no', 'yes', or 'unknown'")
-    housing: str = Field(..., description="Housing must be 'no', 'yes', or 'unknown'")
-    loan: str = Field(..., description="Loan must be 'no', 'yes', or 'unknown'")
-    contact: str = Field(..., description="Contact must be 'cellular' or 'telephone'")
-    month: str = Field(..., description="Month must be 'jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', or 'dec'")
-    day_of_week: str = Field(..., description="Day must be 'mon', 'tue', 'wed', 'thu', or 'fri'")
-    duration: int = Field(..., ge=0, description="Duration must be a non-negative integer")
-    campaign: int = Field(..., ge=0, description="Campaign must be a non-negative integer")
-    pdays: int = Field(..., ge=0, le=999, description="Pdays must be a non-negative integer or 999 if never contacted")
-    previous: int = Field(..., ge=0, description="Previous must be a non-connegative integer")
-    poutcome: str = Field(..., description="Poutcome must be 'failure', 'nonexistent', or 'success'")
-
-    # Validator to prevent empty string inputs
-    @validator('default', 'housing', 'loan', 'contact', 'poutcome', 'month', 'day_of_week', 'education', 'job', 'marital')
-    def check_not_empty(cls, v):
-        if not v:
-            raise ValueError("Field cannot be empty")
-        return v
-
-    # Validation to prevent the education and job inputs from remaining as "string"
-    @validator('education', 'job')
-    def check_not_empty_string(cls, v):
-        if v in {'string'}:  
-            raise ValueError("Field must be filled in accordance")
-        return v 
-
-    # Education input must only contain lowercase letters a-z, digits, and dots
-    @validator('education')
-    def education_validator(cls, v):
-        if any(char not in 'abcdefghijklmnopqrstuvwxyz0123456789.' for char in v.lower()):
-            raise ValueError("Education must only contain lowercase letters a-z, digits, and dots. Use dot for space! (e.g. high.school)")
-        return v
-
-    # Job input must only contain lowercase letters a-z, dots, and dashes
-    @validator('job')
-    def job_validator(cls, v):
-        if any(char not in 'abcdefghijklmnopqrstuvwxyz.-' for char in v.lower()):
-            raise ValueError("Job must only contain lowercase letters a-z, dash, and dots. Use dot for space! (e.g. private.chef)")
-        return v
-
-    # To handle inputs that end with a non-alphabetic character, such as 'admin.'
-    @validator('education', 'job')
-    def trim_invalid_ending_char(cls, v):
-        while len(v) > 0 and v[-1] not in 'abcdefghijklmnopqrstuvwxyz':
-            v = v[:-1]
-        return v
-
-    # Input is validated to be one of "default," "housing," or "loan."
-    @validator('default', 'housing', 'loan')
-    def check_boolean_strings(cls, v):
-        if v not in {'no', 'yes', 'unknown'}:
-            raise ValueError("Must be 'no', 'yes', or 'unknown'")
-        return v
-
-    # Input is validated to be one of "divorced," "married," "single," or "unknown"
-    @validator('marital')
-    def check_marital(cls, v):
-        if v not in {'divorced', 'married', 'single', 'unknown'}:
-            raise ValueError("Must be 'divorced', 'married', 'single', or 'unknown', If you want to input 'widowed', type 'divorced' instead")
-        return v
-
-    # Input is validated to be either "cellular" or "telephone"
-    @validator('contact')
-    def check_contact(cls, v):
-        if v not in {'cellular', 'telephone'}:
-            raise ValueError("Must be 'cellular' or 'telephone'")
-        return v
-    
-    # Input is validated to be either "failure," "nonexistent," or "success"
-    @validator('poutcome')
-    def check_poutcome(cls, v):
-        if v not in {'failure', 'nonexistent', 'success'}:
-            raise ValueError("Must be 'failure', 'nonexistent', or 'success'")
-        return v
-
-    # The input must be the first 3 characters of the month name
-    @validator('month')
-    def check_month(cls, v):
-        if v not in {'jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'}:
-            raise ValueError("Must be 'jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', or 'dec'")
-        return v
-    
-    # The input must consist of the first 3 characters of the day name and be between Monday and Friday.
-    @validator('day_of_week')
-    def check_day_of_week(cls, v):
-        if v not in {'mon', 'tue', 'wed', 'thu', 'fri'}:
-            raise ValueError("Must be 'mon', 'tue', 'wed', 'thu', or 'fri'")
-        return v
+
+from metrics import MetricsRegistry
+from micro_batcher import MicroBatcher
+from model_registry import ModelRegistry, ModelRejected, load_smoke_records
+from parallel_inference import DEFAULT_MIN_PARALLEL_ROWS, ParallelPredictor
+from prediction_cache import PredictionCache
+from ranking import TopK
+import schemas
+from schemas import validate_columns, validate_rows
+from wire_formats import (ARROW, JSON, MSGPACK, FastJSONResponse, UnsupportedFormat, decode_columns,
+                          encode_predictions, loads_json, negotiate)
+
+# Set MODEL_BUNDLE_PATH (e.g. bank_marketing.bundle, built by model_bundle.py) to load everything from one
+# memory-mapped file shared by all workers, instead of unpickling the eight artifacts in every process.
+# Otherwise set COMPILED_MODEL_PATH (e.g. Bagging_dt.npz, built by compiled_model.py) to serve the array-based
+# engine instead of the sklearn pickle; predictions and probabilities are identical
+MODEL_SOURCE = os.getenv('MODEL_BUNDLE_PATH') or os.getenv('COMPILED_MODEL_PATH') or 'Bagging_dt.pkl'
+
+# Every version is scored on a smoke batch (the first SMOKE_BATCH_ROWS valid rows of SMOKE_BATCH_PATH) before it
+# is served. Set MIN_SMOKE_AGREEMENT (e.g. 0.9) to also reject a new version whose labels agree with the served
+# version's on less of that batch.
+SMOKE_BATCH_PATH = os.getenv('SMOKE_BATCH_PATH', 'bank_marketing_data.csv')
+SMOKE_BATCH_ROWS = int(os.getenv('SMOKE_BATCH_ROWS', 256))
+MIN_SMOKE_AGREEMENT = float(os.getenv('MIN_SMOKE_AGREEMENT')) if os.getenv('MIN_SMOKE_AGREEMENT') else None
+registry = ModelRegistry(MODEL_SOURCE, smoke_records=load_smoke_records(SMOKE_BATCH_PATH, SMOKE_BATCH_ROWS),
+                         min_agreement=MIN_SMOKE_AGREEMENT)
+
+# Set MODEL_WATCH_INTERVAL to check the model files every that many seconds and swap in a changed version
+# without a restart. Set ENABLE_MODEL_ADMIN=1 and MODEL_ADMIN_TOKEN to allow reloads and shadow scoring through
+# the /models endpoints: calls must send "Authorization: Bearer <MODEL_ADMIN_TOKEN>", and the model files they
+# name must be inside MODEL_ADMIN_DIR (default: the working directory, where the served artifacts are).
+MODEL_WATCH_INTERVAL = float(os.getenv('MODEL_WATCH_INTERVAL', 0))
+MODEL_ADMIN_ENABLED = os.getenv('ENABLE_MODEL_ADMIN', '').lower() in {'1', 'true', 'yes'}
+MODEL_ADMIN_TOKEN = os.getenv('MODEL_ADMIN_TOKEN')
+MODEL_ADMIN_DIR = os.path.realpath(os.getenv('MODEL_ADMIN_DIR', '.'))
+model_watcher = None
+
+# Set SHADOW_MODEL_PATH to also score SHADOW_SAMPLE_RATE of the traffic on that version in the background
+SHADOW_MODEL_PATH = os.getenv('SHADOW_MODEL_PATH')
+SHADOW_SAMPLE_RATE = float(os.getenv('SHADOW_SAMPLE_RATE', 0.05))
+
+# Maximum number of rows sent to the model in one call by /predict/batch and /rank
+MAX_BATCH_CHUNK_SIZE = int(os.getenv('MAX_BATCH_CHUNK_SIZE', 10000))
+
+# Set INFERENCE_WORKERS to score large /predict/batch chunks on a process pool started with the service.
+# Workers map the served model bundle once each, so it requires MODEL_BUNDLE_PATH.
+INFERENCE_WORKERS = int(os.getenv('INFERENCE_WORKERS', 0))
+PARALLEL_MIN_ROWS = int(os.getenv('PARALLEL_MIN_ROWS', DEFAULT_MIN_PARALLEL_ROWS))
+parallel_predictor = None
+# The workers keep the bundle they mapped at start-up, so they only score the version served then
+parallel_version = None
+
+# Set MICRO_BATCH_SIZE to coalesce concurrent /predict/ requests into one model call of up to that many rows,
+# flushed after at most MICRO_BATCH_WAIT_MS milliseconds
+MICRO_BATCH_SIZE = int(os.getenv('MICRO_BATCH_SIZE', 0))
+MICRO_BATCH_WAIT_MS = float(os.getenv('MICRO_BATCH_WAIT_MS', 2))
+micro_batcher = None
+
+# Predictions of recently seen customers; PREDICTION_CACHE_SIZE=0 disables the cache
+PREDICTION_CACHE_SIZE = int(os.getenv('PREDICTION_CACHE_SIZE', 10000))
+PREDICTION_CACHE_TTL = float(os.getenv('PREDICTION_CACHE_TTL', 3600))
+prediction_cache = PredictionCache(PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL) if PREDICTION_CACHE_SIZE > 0 else None
+
+# Set ENABLE_PROFILING=1 to let callers send "X-Profile: 1" on /predict/; the call then runs under cProfile and
+# the stats are written to PROFILE_DIR (open with snakeviz or flameprof for a flamegraph)
+PROFILING_ENABLED = os.getenv('ENABLE_PROFILING', '').lower() in {'1', 'true', 'yes'}
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+
+# Prometheus metrics, served at /metrics
+metrics = MetricsRegistry()
+STAGE_SECONDS = metrics.histogram('bank_prediction_stage_seconds', 'Time spent in each stage of a prediction request',
+                                  ['endpoint', 'stage'])
+REQUESTS = metrics.counter('bank_prediction_requests_total', 'Prediction requests by outcome', ['endpoint', 'outcome'])
+ROWS = metrics.counter('bank_prediction_rows_total', 'Rows answered, by the model or from the prediction cache',
+                       ['endpoint', 'source'])
+FAILURES = metrics.counter('bank_prediction_failures_total', 'Failed rows or requests by the stage that failed',
+                           ['endpoint', 'stage'])
+CACHE_STATS = metrics.gauge('bank_prediction_cache', 'Prediction cache size and hit/miss/eviction counts', ['stat'])
+BATCHER_STATS = metrics.gauge('bank_prediction_micro_batcher', 'Micro-batcher queue depth and batch counts', ['stat'])
+MODEL_INFO = metrics.gauge('bank_prediction_model_info', 'Version of the model being served (value 1)', ['version'])
+MODEL_STATS = metrics.gauge('bank_prediction_model_registry', 'Model swaps and rejected versions', ['stat'])
+SHADOW_STATS = metrics.gauge('bank_prediction_shadow', 'Shadow scoring samples, agreement and latency', ['stat'])
+
+
+async def watch_model_files():
+    while True:
+        await asyncio.sleep(MODEL_WATCH_INTERVAL)
+        # Loading, warming and checking run in a worker thread; requests keep being served meanwhile
+        await run_in_threadpool(registry.poll)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global parallel_predictor, parallel_version, micro_batcher, model_watcher
+    if INFERENCE_WORKERS > 0:
+        served = registry.current
+        if served.checksum is None:
+            raise RuntimeError(f"INFERENCE_WORKERS requires MODEL_BUNDLE_PATH: the workers map a model bundle, "
+                               f"but the service serves {served.source}")
+        parallel_predictor = ParallelPredictor(served.source, workers=INFERENCE_WORKERS,
+                                               min_parallel_rows=PARALLEL_MIN_ROWS)
+        if parallel_predictor.checksum != served.checksum:
+            parallel_predictor.close()
+            parallel_predictor = None
+            raise RuntimeError(f"{served.source} changed while the service started; restart it")
+        parallel_version = served
+    if MICRO_BATCH_SIZE > 0:
+        micro_batcher = MicroBatcher(score_micro_batch, max_batch_size=MICRO_BATCH_SIZE,
+                                     max_wait=MICRO_BATCH_WAIT_MS / 1000)
+        await micro_batcher.start()
+    if SHADOW_MODEL_PATH:
+        registry.start_shadow(SHADOW_MODEL_PATH, SHADOW_SAMPLE_RATE)
+    if MODEL_WATCH_INTERVAL > 0:
+        model_watcher = asyncio.create_task(watch_model_files())
+    yield
+    if model_watcher is not None:
+        model_watcher.cancel()
+        try:
+            await model_watcher
+        except asyncio.CancelledError:
+            pass
+        model_watcher = None
+    registry.stop_shadow()
+    if micro_batcher is not None:
+        await micro_batcher.stop()
+        micro_batcher = None
+    if parallel_predictor is not None:
+        parallel_predictor.close()
+        parallel_predictor = None
+
+
+# Responses are serialized with orjson rather than the standard json module
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+
+
+def score_features(served, features, timings=None):
+    """Labels and "yes" probabilities of the `served` model version for an encoded feature matrix,
+    on the worker pool when it is enabled, holds that version and the matrix has at least PARALLEL_MIN_ROWS rows.
+
+    `timings`, if given, receives the seconds spent in the 'alignment' and 'predict' steps.
+    """
+    use_pool = (parallel_predictor is not None and served is parallel_version
+                and len(features) >= parallel_predictor.min_parallel_rows)
+    return served.score(features, timings=timings, pool=parallel_predictor if use_pool else None)
+
+
+def score_rows(served, features, timings=None):
+    """[(label, probability)] per row of an encoded feature matrix, as plain Python values."""
+    labels, probabilities = score_features(served, features, timings=timings)
+    return list(zip(labels.tolist(), probabilities.tolist()))
+
+
+def score_micro_batch(items):
+    """Results for micro-batched (model version, feature row) items, scored together per version.
+
+    A batch only mixes versions right after a swap: each request keeps the version it was encoded with.
+    """
+    by_version = {}
+    for i, (served, _) in enumerate(items):
+        by_version.setdefault(id(served), (served, []))[1].append(i)
+    results = [None] * len(items)
+    for served, index in by_version.values():
+        for i, result in zip(index, score_rows(served, np.vstack([items[i][1] for i in index]))):
+            results[i] = result
+    return results
+
+
+def offer_shadow(records, labels, probabilities, timings):
+    """Queue a sample of scored records for the shadow candidate, if one is running; never waits."""
+    shadow = registry.shadow
+    if shadow is not None:
+        shadow.offer(records, labels, probabilities, timings.get('predict', 0.0))
+
+
+def observe_stages(endpoint, timings):
+    for stage, seconds in timings.items():
+        STAGE_SECONDS.observe(seconds, endpoint=endpoint, stage=stage)
+
+
+def prediction_failed(endpoint, stage, e):
+    FAILURES.inc(endpoint=endpoint, stage=stage)
+    REQUESTS.inc(endpoint=endpoint, outcome='error')
+    return HTTPException(status_code=400, detail=f"Error in prediction: {str(e)}")
+
+
+def require_model_admin(request):
+    if not MODEL_ADMIN_ENABLED or not MODEL_ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Model administration is disabled; set ENABLE_MODEL_ADMIN=1 "
+                                                    "and MODEL_ADMIN_TOKEN")
+    scheme, _, token = request.headers.get('authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not hmac.compare_digest(token.encode(), MODEL_ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Missing or wrong model admin token",
+                            headers={'WWW-Authenticate': 'Bearer'})
+
+
+def admin_model_path(path):
+    """`path` (relative to MODEL_ADMIN_DIR, symlinks resolved) if it is a file inside MODEL_ADMIN_DIR.
+
+    Anything else is refused: loading a pickle runs code from it.
+    """
+    if path is None:
+        return None
+    resolved = os.path.realpath(os.path.join(MODEL_ADMIN_DIR, path))
+    if os.path.commonpath([resolved, MODEL_ADMIN_DIR]) != MODEL_ADMIN_DIR or not os.path.isfile(resolved):
+        raise HTTPException(status_code=403, detail=f"{path!r} is not a model file inside MODEL_ADMIN_DIR")
+    return resolved
+
+
+def profiling_requested(request):
+    return PROFILING_ENABLED and request.headers.get('x-profile', '').lower() in {'1', 'true', 'yes'}
+
+
+def run_profiled(fn, *args):
+    """Run fn under cProfile and write the stats to PROFILE_DIR; returns (result, path of the .prof file)."""
+    profiler = cProfile.Profile()
+    result = profiler.runcall(fn, *args)
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"predict-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.prof")
+    profiler.dump_stats(path)
+    return result, path
+
+
+class Data(schemas.Data):
+    # Same fields and rules as schemas.Data; also records validation time and failures for /predict/
+    @model_validator(mode='wrap')
+    @classmethod
+    def observe_validation(cls, values, handler):
+        start = time.perf_counter()
+        try:
+            return handler(values)
+        except ValidationError:
+            FAILURES.inc(endpoint='predict', stage='validation')
+            REQUESTS.inc(endpoint='predict', outcome='invalid')
+            raise
+        finally:
+            STAGE_SECONDS.observe(time.perf_counter() - start, endpoint='predict', stage='validation')
+
+
+class BatchData(BaseModel):
+    # Either a list of records shaped like Data, or a columnar payload {"age": [...], "job": [...], ...}
+    records: Optional[List[Dict[str, Any]]] = None
+    columns: Optional[Dict[str, List[Any]]] = None
+
+    @model_validator(mode='after')
+    def check_one_payload(self):
+        if (self.records is None) == (self.columns is None):
+            raise ValueError("Provide exactly one of 'records' or 'columns'")
+        if self.columns is not None and len({len(values) for values in self.columns.values()}) > 1:
+            raise ValueError("All columns must have the same length")
+        return self
+
+    def rows(self):
+        if self.records is not None:
+            return self.records
+        names = list(self.columns)
+        return [dict(zip(names, values)) for values in zip(*self.columns.values())]
+
+
+class RankData(BatchData):
+    # Optional lead ids, one per row (default: the row's position); k best leads are returned,
+    # leaving out those below the probability threshold
+    ids: Optional[List[Any]] = None
+    k: int = Field(100, gt=0)
+    threshold: Optional[float] = Field(None, ge=0, le=1)
+
+    @model_validator(mode='after')
+    def check_ids(self):
+        if self.ids is not None and len(self.ids) != len(self.rows()):
+            raise ValueError("'ids' must have one entry per row")
+        return self
+
+
+class ReloadRequest(BaseModel):
+    # Model bundle, .npz or .pkl inside MODEL_ADMIN_DIR to serve; default: reload the source being served
+    path: Optional[str] = None
+
+
+class ShadowRequest(BaseModel):
+    path: str
+    sample_rate: float = Field(0.05, gt=0, le=1)
 
 
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the Bank Marketing Classification System - Developed by Elvina"}
 
+@app.get("/stats/batcher")
+def batcher_stats():
+    if micro_batcher is None:
+        return {"enabled": False}
+    return {"enabled": True, **micro_batcher.stats()}
+
+@app.get("/stats/cache")
+def cache_stats():
+    if prediction_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **prediction_cache.stats()}
+
+@app.get("/metrics")
+def prometheus_metrics():
+    if prediction_cache is not None:
+        for name, value in prediction_cache.stats().items():
+            if name in {'size', 'hits', 'misses', 'evictions', 'expirations', 'invalidations'}:
+                CACHE_STATS.set(value, stat=name)
+    if micro_batcher is not None:
+        batcher = micro_batcher.stats()
+        for name in ['queue_depth', 'max_queue_depth', 'batches', 'items']:
+            BATCHER_STATS.set(batcher[name], stat=name)
+    for (version,) in list(MODEL_INFO.values):
+        MODEL_INFO.set(0, version=version)
+    MODEL_INFO.set(1, version=registry.current.version)
+    registry_stats = registry.stats()
+    for name in ['swaps', 'rejections']:
+        MODEL_STATS.set(registry_stats[name], stat=name)
+    if registry_stats['shadow'] is not None:
+        for name, value in registry_stats['shadow'].items():
+            if isinstance(value, (int, float)):
+                SHADOW_STATS.set(value, stat=name)
+    return PlainTextResponse(metrics.render(), media_type='text/plain; version=0.0.4')
+
+@app.get("/models")
+def model_status():
+    return {"watch_interval": MODEL_WATCH_INTERVAL, **registry.stats()}
+
+@app.post("/models/reload")
+async def reload_model(reload: ReloadRequest, request: Request):
+    """Load, warm and smoke-check a version in a worker thread, then swap it in; running requests finish on the old one."""
+    require_model_admin(request)
+    path = admin_model_path(reload.path)
+    previous = registry.current
+    try:
+        current = await run_in_threadpool(registry.reload, path)
+    except ModelRejected as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"swapped": current is not previous, "previous": previous.info(), "current": current.info()}
+
+@app.post("/models/shadow")
+async def start_shadow(shadow: ShadowRequest, request: Request):
+    require_model_admin(request)
+    path = admin_model_path(shadow.path)
+    try:
+        scorer = await run_in_threadpool(registry.start_shadow, path, shadow.sample_rate)
+    except ModelRejected as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return scorer.stats()
+
+@app.delete("/models/shadow")
+async def stop_shadow(request: Request):
+    require_model_admin(request)
+    scorer = await run_in_threadpool(registry.stop_shadow)
+    return scorer.stats() if scorer is not None else None
+
+@app.post("/models/shadow/promote")
+async def promote_shadow(request: Request):
+    """Serve the shadow candidate, which was loaded and checked when shadow scoring started."""
+    require_model_admin(request)
+    previous = registry.current
+    try:
+        current = await run_in_threadpool(registry.promote_shadow)
+    except ModelRejected as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"swapped": current is not previous, "previous": previous.info(), "current": current.info()}
+
+def score_record(served, record, timings):
+    """Encode and predict one validated record synchronously (used for profiled requests)."""
+    return score_rows(served, served.encoder.encode_records([record], timings=timings), timings=timings)[0]
+
 @app.post("/predict/")
-def predict(data: Data):
+async def predict(data: Data, request: Request, response: Response):
+    start = time.perf_counter()
+    timings = {}
+    record = data.model_dump()
+    # The version this request is answered with, even if another one is swapped in meanwhile
+    served = registry.current
+    if prediction_cache is not None:
+        lookup_start = time.perf_counter()
+        cached = prediction_cache.get(record, served.fingerprint)
+        if cached is not None:
+            # Answered without the model, but still a request with a latency and a row
+            end = time.perf_counter()
+            STAGE_SECONDS.observe(end - lookup_start, endpoint='predict', stage='cache')
+            STAGE_SECONDS.observe(end - start, endpoint='predict', stage='total')
+            REQUESTS.inc(endpoint='predict', outcome='cached')
+            ROWS.inc(endpoint='predict', source='cache')
+            return {"prediction": cached[0], "probability": cached[1]}
+
+    if profiling_requested(request):
+        try:
+            (prediction, probability), path = await run_in_threadpool(run_profiled, score_record, served, record, timings)
+        except Exception as e:
+            raise prediction_failed('predict', 'profiled', e)
+        response.headers['X-Profile-Path'] = path
+    else:
+        try:
+            features = served.encoder.encode_records([record], timings=timings)
+        except Exception as e:
+            raise prediction_failed('predict', 'encoding', e)
+
+        # The model call never runs on the event loop: it goes to the micro-batcher or to the threadpool
+        try:
+            if micro_batcher is not None:
+                predict_start = time.perf_counter()
+                prediction, probability = await micro_batcher.submit((served, features[0]))
+                timings['predict'] = time.perf_counter() - predict_start
+            else:
+                prediction, probability = (await run_in_threadpool(score_rows, served, features, timings))[0]
+        except Exception as e:
+            raise prediction_failed('predict', 'predict', e)
+
+    if prediction_cache is not None:
+        prediction_cache.put(record, served.fingerprint, (prediction, probability))
+    offer_shadow([record], [prediction], [probability], timings)
+    observe_stages('predict', timings)
+    STAGE_SECONDS.observe(time.perf_counter() - start, endpoint='predict', stage='total')
+    REQUESTS.inc(endpoint='predict', outcome='ok')
+    ROWS.inc(endpoint='predict', source='model')
+    return {"prediction": prediction, "probability": probability}
+
+def score_batch(body, request_format, response_format):
+    """Validate, encode and score a /predict/batch body; returns the response body in `response_format`."""
+    start = time.perf_counter()
+    served = registry.current
+    if request_format == JSON:
+        # Parse then model_validate: faster than model_validate_json for the Any-typed record values
+        try:
+            payload = loads_json(body)
+        except json.JSONDecodeError as e:
+            raise RequestValidationError([{'type': 'json_invalid', 'loc': ('body', e.pos), 'msg': 'JSON decode error',
+                                           'input': {}, 'ctx': {'error': e.msg}}])
+        try:
+            batch = BatchData.model_validate(payload)
+        except ValidationError as e:
+            raise RequestValidationError([{**error, 'loc': ('body', *error['loc'])}
+                                          for error in e.errors(include_url=False)])
+        records, columns = batch.records, batch.columns
+        n_rows = len(records) if records is not None else len(next(iter(columns.values()), []))
+    else:
+        records = None
+        try:
+            columns, n_rows = decode_columns(body, request_format)
+        except UnsupportedFormat:
+            raise
+        except Exception as e:
+            FAILURES.inc(endpoint='predict_batch', stage='decoding')
+            REQUESTS.inc(endpoint='predict_batch', outcome='invalid')
+            raise HTTPException(status_code=400, detail=f"Invalid {request_format} body: {e}")
+
+    if records is not None:
+        valid_index, valid_rows, errors = validate_rows(records)
+
+        def chunk_of(chunk_start, chunk_stop):
+            return valid_rows[chunk_start:chunk_stop]
+
+        def encode(chunk, n_chunk_rows, timings):
+            return served.encoder.encode_records(chunk, timings=timings)
+    else:
+        # Columnar payloads go from arrays to the feature matrix without a Python object per row
+        valid_index, valid_columns, errors = validate_columns(columns, n_rows)
+
+        def chunk_of(chunk_start, chunk_stop):
+            return {name: values[chunk_start:chunk_stop] for name, values in valid_columns.items()}
+
+        def encode(chunk, n_chunk_rows, timings):
+            return served.encoder.encode_columns(chunk, n_chunk_rows, timings=timings)
+    STAGE_SECONDS.observe(time.perf_counter() - start, endpoint='predict_batch', stage='validation')
+    if errors:
+        FAILURES.inc(len(errors), endpoint='predict_batch', stage='validation')
+
+    labels, probabilities = [], []
+    for chunk_start in range(0, len(valid_index), MAX_BATCH_CHUNK_SIZE):
+        timings = {}
+        chunk_stop = min(chunk_start + MAX_BATCH_CHUNK_SIZE, len(valid_index))
+        chunk = chunk_of(chunk_start, chunk_stop)
+        try:
+            features = encode(chunk, chunk_stop - chunk_start, timings)
+        except Exception as e:
+            raise prediction_failed('predict_batch', 'encoding', e)
+        try:
+            chunk_labels, chunk_probabilities = score_features(served, features, timings=timings)
+        except Exception as e:
+            raise prediction_failed('predict_batch', 'predict', e)
+        offer_shadow(chunk, chunk_labels, chunk_probabilities, timings)
+        observe_stages('predict_batch', timings)
+        labels.append(chunk_labels)
+        probabilities.append(chunk_probabilities)
+
+    serialize_start = time.perf_counter()
+    content = encode_predictions(response_format, n_rows, valid_index,
+                                 np.concatenate(labels) if labels else np.empty(0, dtype=object),
+                                 np.concatenate(probabilities) if probabilities else np.empty(0),
+                                 errors, served.model.classes_)
+    STAGE_SECONDS.observe(time.perf_counter() - serialize_start, endpoint='predict_batch', stage='serialization')
+    STAGE_SECONDS.observe(time.perf_counter() - start, endpoint='predict_batch', stage='total')
+    REQUESTS.inc(endpoint='predict_batch', outcome='ok')
+    ROWS.inc(len(valid_index), endpoint='predict_batch', source='model')
+    return content
+
+BINARY_BODY = {'schema': {'type': 'string', 'format': 'binary'}}
+
+@app.post("/predict/batch", openapi_extra={'requestBody': {'required': True, 'content': {
+    JSON: {'schema': BatchData.model_json_schema()}, MSGPACK: BINARY_BODY, ARROW: BINARY_BODY}}})
+async def predict_batch(request: Request):
+    """Predictions for many customers. The body is a BatchData JSON object, or (Content-Type) a columnar
+    MessagePack map or Arrow IPC stream; the response uses the Accept type, by default the request's."""
     try:
-        input_data = pd.DataFrame([data.dict()])
-
-        # Encoding job
-        for value in job_train_unique:
-            input_data[f"job_{value}"] = 0
-        input_data['job_other'] = 0
-        if data.job in job_train_unique:
-            input_data[f"job_{data.job}"] = 1
-        else:
-            input_data['job_other'] = 1
-
-        # Encoding marital
-        for value in marital_train_unique:
-            input_data[f"marital_{value}"] = 0
-        if data.marital in marital_train_unique:
-            input_data[f"marital_{data.marital}"] = 1
-
-        # Encoding education
-        for value in education_train_unique:
-            input_data[f"education_{value}"] = 0
-        input_data['education_other'] = 0
-        if data.education in education_train_unique:
-            input_data[f"education_{data.education}"] = 1
-        else:
-            input_data['education_other'] = 1
-
-        # Encoding month
-        for value in month_train_unique:
-            input_data[f"month_{value}"] = 0
-        if data.month in month_train_unique:
-            input_data[f"month_{data.month}"] = 1
-
-        # Encoding day of week
-        for value in dow_train_unique:
-            input_data[f"day_of_week_{value}"] = 0
-        if data.month in month_train_unique:
-            input_data[f"day_of_week_{data.day_of_week}"] = 1
-
-        # Mapping categorical variables (encode)
-        input_data = input_data.apply(lambda col: col.map(mappings['categorical_mappings'][col.name]) if col.name in mappings['categorical_mappings'] else col)
-
-        input_data['contact_status'] = input_data['pdays'].apply(lambda x: 1 if x != 999 else 0)
-
-        # Standard scaler
-        num_cols = ['age', 'duration', 'campaign', 'previous']
-        input_data[num_cols] = scaler.transform(input_data[num_cols])
-
-        all_columns = model.feature_names_in_
-        for col in all_columns:
-            if col not in input_data.columns:
-                input_data[col] = 0
-
-        input_data = input_data[all_columns]
-
-        prediction = model.predict(input_data)
-
-        return {"prediction": prediction[0]}
+        request_format = negotiate(request.headers.get('content-type', ''))
+    except UnsupportedFormat as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    try:
+        response_format = negotiate(request.headers.get('accept', ''), default=request_format)
+    except UnsupportedFormat as e:
+        raise HTTPException(status_code=406, detail=str(e))
+    body = await request.body()
+    try:
+        content = await run_in_threadpool(score_batch, body, request_format, response_format)
+    except UnsupportedFormat as e:
+        # The format is known but its library (msgpack or pyarrow) is not installed
+        raise HTTPException(status_code=415, detail=str(e))
+    return Response(content, media_type=response_format)
+
+@app.post("/rank")
+def rank(batch: RankData):
+    """The k leads most likely to subscribe, scored chunk by chunk into a bounded heap."""
+    start = time.perf_counter()
+    served = registry.current
+    rows = batch.rows()
+    ids = batch.ids if batch.ids is not None else list(range(len(rows)))
+    top = TopK(batch.k, batch.threshold)
+    errors = []
+    scored = 0
+    for chunk_start in range(0, len(rows), MAX_BATCH_CHUNK_SIZE):
+        valid_index, valid_rows, chunk_errors = validate_rows(rows[chunk_start:chunk_start + MAX_BATCH_CHUNK_SIZE])
+        errors.extend({**error, "index": chunk_start + error["index"]} for error in chunk_errors)
+        if not valid_rows:
+            continue
+        try:
+            features = served.encoder.encode_records(valid_rows)
+        except Exception as e:
+            raise prediction_failed('rank', 'encoding', e)
+        timings = {}
+        try:
+            labels, probabilities = score_features(served, features, timings=timings)
+        except Exception as e:
+            raise prediction_failed('rank', 'predict', e)
+        offer_shadow(valid_rows, labels, probabilities, timings)
+        top.push(probabilities, [ids[chunk_start + i] for i in valid_index])
+        scored += len(valid_rows)
+
+    if errors:
+        FAILURES.inc(len(errors), endpoint='rank', stage='validation')
+    STAGE_SECONDS.observe(time.perf_counter() - start, endpoint='rank', stage='total')
+    REQUESTS.inc(endpoint='rank', outcome='ok')
+    ROWS.inc(scored, endpoint='rank', source='model')
+    ranking = [{"rank": position, "id": lead_id, "probability": probability}
+               for position, (lead_id, probability) in enumerate(top.results(), start=1)]
+    # Returned as a response directly, skipping FastAPI's jsonable_encoder pass over every entry
+    return FastJSONResponse({"ranking": ranking, "scored": scored, "errors": errors})
+
+@app.post("/explain")
+def explain(data: schemas.Data):
+    """Prediction for one customer, with how much each input field moved its probability of "yes" from the bias."""
+    start = time.perf_counter()
+    served = registry.current
+    try:
+        features = served.encoder.encode_records([data.model_dump()])
     except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Error in prediction: {str(e)}")
+        raise prediction_failed('explain', 'encoding', e)
+    try:
+        explanation = served.explainer.explain_records(features)[0]
+    except Exception as e:
+        raise prediction_failed('explain', 'predict', e)
+    STAGE_SECONDS.observe(time.perf_counter() - start, endpoint='explain', stage='total')
+    REQUESTS.inc(endpoint='explain', outcome='ok')
+    ROWS.inc(endpoint='explain', source='model')
+    return explanation
+
+@app.post("/explain/batch")
+def explain_batch(batch: BatchData):
+    start = time.perf_counter()
+    served = registry.current
+    rows = batch.rows()
+    explanations = [None] * len(rows)
+    valid_index, valid_rows, errors = validate_rows(rows)
+    if errors:
+        FAILURES.inc(len(errors), endpoint='explain_batch', stage='validation')
+
+    for chunk_start in range(0, len(valid_rows), MAX_BATCH_CHUNK_SIZE):
+        try:
+            features = served.encoder.encode_records(valid_rows[chunk_start:chunk_start + MAX_BATCH_CHUNK_SIZE])
+        except Exception as e:
+            raise prediction_failed('explain_batch', 'encoding', e)
+        try:
+            chunk_explanations = served.explainer.explain_records(features)
+        except Exception as e:
+            raise prediction_failed('explain_batch', 'predict', e)
+        for i, explanation in zip(valid_index[chunk_start:chunk_start + MAX_BATCH_CHUNK_SIZE], chunk_explanations):
+            explanations[i] = explanation
+
+    STAGE_SECONDS.observe(time.perf_counter() - start, endpoint='explain_batch', stage='total')
+    REQUESTS.inc(endpoint='explain_batch', outcome='ok')
+    ROWS.inc(len(valid_rows), endpoint='explain_batch', source='model')
+    return FastJSONResponse({"explanations": explanations, "errors": errors})
 
 if __name__ == "__main__":
     import uvicorn
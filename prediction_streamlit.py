@@ -1,17 +1,55 @@
 import streamlit as st
 import joblib
+import os
 import numpy as np
 import pandas as pd
 
-# Load model and artifacts
-model = joblib.load('Bagging_dt.pkl')
-mappings = joblib.load('mappings.pkl')
-scaler = joblib.load('standard_scaler.pkl')
-job_train_unique = joblib.load('job_train_unique.pkl')
-education_train_unique = joblib.load('education_train_unique.pkl')
-marital_train_unique = joblib.load('marital_train_unique.pkl')
-month_train_unique = joblib.load('month_train_unique.pkl')
-dow_train_unique = joblib.load('dow_train_unique.pkl')
+from batch_score import score_frame
+from explainer import TreePathExplainer
+from feature_encoder import INPUT_COLUMNS, FeatureEncoder
+from model_bundle import artifact_version, load_bundle
+from prediction_cache import PredictionCache
+from ranking import POSITIVE_CLASS
+
+ARTIFACTS = ['Bagging_dt.pkl', 'mappings.pkl', 'standard_scaler.pkl', 'job_train_unique.pkl', 'education_train_unique.pkl',
+             'marital_train_unique.pkl', 'month_train_unique.pkl', 'dow_train_unique.pkl']
+
+# Rows scored per step of an uploaded file; the progress bar moves once per chunk
+UPLOAD_CHUNK_SIZE = 20000
+
+# Update month and day of week to full names
+MONTH_NAMES = [('jan', 'January'), ('feb', 'February'), ('mar', 'March'), ('apr', 'April'), ('may', 'May'),
+               ('jun', 'June'), ('jul', 'July'), ('aug', 'August'), ('sep', 'September'), ('oct', 'October'),
+               ('nov', 'November'), ('dec', 'December')]
+DAY_NAMES = [('mon', 'Monday'), ('tue', 'Tuesday'), ('wed', 'Wednesday'), ('thu', 'Thursday'), ('fri', 'Friday')]
+
+
+# Load model and artifacts once per server process (not on every rerun), from a single
+# memory-mapped bundle when MODEL_BUNDLE_PATH is set
+@st.cache_resource
+def load_artifacts():
+    if os.getenv('MODEL_BUNDLE_PATH'):
+        bundle = load_bundle(os.getenv('MODEL_BUNDLE_PATH'))
+        return bundle.model, bundle.encoder, bundle.version, bundle.vocabularies
+
+    model, mappings, scaler, job_train_unique, education_train_unique, marital_train_unique, month_train_unique, \
+        dow_train_unique = [joblib.load(path) for path in ARTIFACTS]
+    encoder = FeatureEncoder.from_artifacts(model, mappings, scaler, job_train_unique, education_train_unique,
+                                            marital_train_unique, month_train_unique, dow_train_unique)
+    vocabularies = {'job': job_train_unique, 'education': education_train_unique, 'marital': marital_train_unique}
+    return model, encoder, artifact_version(ARTIFACTS), vocabularies
+
+
+# Per-node path contributions, precomputed once per server process
+@st.cache_resource
+def get_explainer():
+    return TreePathExplainer.from_model(load_artifacts()[0], POSITIVE_CLASS)
+
+
+# Kept across reruns, so repeated clicks on the same customer are answered from memory
+@st.cache_resource
+def get_prediction_cache():
+    return PredictionCache(max_size=10000, ttl=3600)
 
 def format_job(job):
     return job.replace('blue-collar', 'Blue collar').title()
@@ -22,134 +60,166 @@ def format_education(education):
 def format_capitalized(text):
     return text.capitalize()
 
-# Update month and day of week to full names
-full_months = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 
-               'August', 'September', 'October', 'November', 'December']
-
-full_days_of_week = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
+# Display label -> model value for every selectbox, built once per server process.
+# Mapping labels back (instead of lowercasing them) keeps e.g. 'Blue Collar' -> 'blue-collar' and 'January' -> 'jan'.
+@st.cache_resource
+def get_options():
+    vocabularies = load_artifacts()[3]
+    yes_no = {'No': 'no', 'Yes': 'yes', 'Unknown': 'unknown'}
+    return {
+        'job': {format_job(job): job for job in vocabularies['job']},
+        'marital': {format_capitalized(status): status for status in vocabularies['marital']},
+        'education': {format_education(edu): edu for edu in vocabularies['education']},
+        'default': yes_no,
+        'housing': yes_no,
+        'loan': yes_no,
+        'contact': {'Cellular': 'cellular', 'Telephone': 'telephone'},
+        'month': {name: month for month, name in MONTH_NAMES},
+        'day_of_week': {name: day for day, name in DAY_NAMES},
+        'poutcome': {'Failure': 'failure', 'Non-existent': 'nonexistent', 'Success': 'success'},
+    }
+
+model, encoder, model_version, _ = load_artifacts()
+prediction_cache = get_prediction_cache()
+explainer = get_explainer()
+options = get_options()
+positive_index = list(model.classes_).index(POSITIVE_CLASS)
 
 def predict(input_data):
-    # Encoding job
-    for value in job_train_unique:
-        input_data[f"job_{value}"] = 0
-    input_data['job_other'] = 0
-    job_value = input_data['job'].iloc[0]  # Get the job value
-    if job_value in job_train_unique:
-        input_data[f"job_{job_value}"] = 1
-    else:
-        input_data['job_other'] = 1
-
-    # Encoding marital
-    for value in marital_train_unique:
-        input_data[f"marital_{value}"] = 0
-    marital_value = input_data['marital'].iloc[0]  # Get the marital value
-    if marital_value in marital_train_unique:
-        input_data[f"marital_{marital_value}"] = 1
-
-    # Encoding education
-    for value in education_train_unique:
-        input_data[f"education_{value}"] = 0
-    input_data['education_other'] = 0
-    education_value = input_data['education'].iloc[0]  # Get the education value
-    if education_value in education_train_unique:
-        input_data[f"education_{education_value}"] = 1
-    else:
-        input_data['education_other'] = 1
-
-    # Encoding month
-    for value in month_train_unique:
-        input_data[f"month_{value}"] = 0
-    month_value = input_data['month'].iloc[0]  # Get the month value
-    if month_value in month_train_unique:
-        input_data[f"month_{month_value}"] = 1
-    else:
-        input_data['month_other'] = 1
-
-    # Encoding day of week
-    for value in dow_train_unique:
-        input_data[f"day_of_week_{value}"] = 0
-    dow_value = input_data['day_of_week'].iloc[0]  # Get the day of week value
-    if dow_value in dow_train_unique:
-        input_data[f"day_of_week_{dow_value}"] = 1
-
-    # Mapping categorical variables (encode)
-    input_data = input_data.apply(lambda col: col.map(mappings['categorical_mappings'][col.name]) if col.name in mappings['categorical_mappings'] else col)
-    
-    input_data['contact_status'] = input_data['pdays'].apply(lambda x: 1 if x != 999 else 0)
-
-    # Standard scaler
-    num_cols = ['age', 'duration', 'campaign', 'previous']
-    input_data[num_cols] = scaler.transform(input_data[num_cols])
-
-    all_columns = model.feature_names_in_
+    """(prediction, probability of "yes") for a one-row DataFrame of raw inputs."""
+    record = input_data.iloc[0].to_dict()
+    cached = prediction_cache.get(record, model_version)
+    if cached is not None:
+        return cached
+
+    # One-hot encoding, categorical mappings and scaling, in the model's column order
+    features = encoder.encode_frame(input_data)
 
     # Only for checking purposes
-    # st.write("Feature Names Used in the Model:", all_columns)  # Display the feature names in the app
-    # st.write("All Cols Before Deleted:", input_data)
+    # st.write("Final Input Data After Preprocessing:", encoder.to_frame(features))
 
-    # Remove unnecessary columns
-    for col in all_columns:
-        if col not in input_data.columns:
-            input_data[col] = 0
+    proba = model.predict_proba(encoder.to_frame(features))[0]
+    result = (model.classes_[np.argmax(proba)], float(proba[positive_index]))
+    prediction_cache.put(record, model_version, result)
+    return result
 
-    input_data = input_data[all_columns]
+def explain(input_data):
+    """Bias and contribution of each input field to the probability of "yes" for a one-row DataFrame."""
+    return explainer.explain_records(encoder.encode_frame(input_data))[0]
 
-    # Only for checking purposes
-    # st.write("Columns in Input Data After Encoding:", input_data.columns.tolist())
-    # st.write("Final Input Data After Preprocessing:", input_data)
+def score_upload(data, progress):
+    """Score an uploaded DataFrame chunk by chunk; returns it with prediction, probability and error columns."""
+    scored = []
+    for start in range(0, len(data), UPLOAD_CHUNK_SIZE):
+        chunk = data.iloc[start:start + UPLOAD_CHUNK_SIZE]
+        scored.append(score_frame(model, encoder, chunk, np.arange(start, start + len(chunk))))
+        done = start + len(chunk)
+        progress.progress(done / len(data), text=f"Scored {done:,} of {len(data):,} customers")
+    scored = pd.concat(scored, ignore_index=True).drop(columns='id')
+    return pd.concat([data.reset_index(drop=True).drop(columns=scored.columns, errors='ignore'), scored], axis=1)
 
-    return model.predict(input_data)[0]
+def select(label, field):
+    return options[field][st.selectbox(label, list(options[field]))]
 
 
 st.title("Bank Marketing Prediction 🏦💰")
-st.write("Input customer data to determine customer potential for bank offers!")
-
-# User inputs
-age = st.number_input("Age", min_value=17, max_value=100)
-job = st.selectbox("Job 💼", [format_job(job) for job in job_train_unique])
-marital = st.selectbox("Marital Status 💍", [format_capitalized(status) for status in marital_train_unique])
-education = st.selectbox("Educational Level 🎓🏫", [format_education(edu) for edu in education_train_unique])
-default = st.selectbox("Credit in Default?", ["No", "Yes", "Unknown"])
-housing = st.selectbox("Has Housing Loan? 🏠", ["No", "Yes", "Unknown"])
-loan = st.selectbox("Has Personal Loan?", ["No", "Yes", "Unknown"])
-contact = st.selectbox("Contact Communication Type 📞", ["Cellular", "Telephone"])
-month = st.selectbox("Last Contact Month", full_months)
-day_of_week = st.selectbox("Last Contact Day of the Week", full_days_of_week)
-duration = st.number_input("Last Contact Duration (seconds)", min_value=0)
-campaign = st.number_input("Number of Contacts During Campaign", min_value=0)
-pdays = st.number_input("Days Since Last Contact", min_value=0, max_value=999)
-previous = st.number_input("Previous Contact Count ⏮️", min_value=0)
-poutcome = st.selectbox("Outcome of Previous Campaign", ["Failure", "Non-existent", "Success"])
-
-if st.button("Predict"):
-    input_data = pd.DataFrame({
-        'age': [age],
-        'job': [job.lower()],  
-        'marital': [marital.lower()],
-        'education': [education.lower().replace(' ', '.')],  
-        'default': [default.lower()],
-        'housing': [housing.lower()],
-        'loan': [loan.lower()],
-        'contact': [contact.lower()],
-        'month': [month.lower()],
-        'day_of_week': [day_of_week[:3].lower()],  
-        'duration': [duration],
-        'campaign': [campaign],
-        'pdays': [pdays],
-        'previous': [previous],
-        'poutcome': [poutcome.lower().replace('-', '')]
-    })
-
-    prediction = predict(input_data)
-
-    if prediction == 'yes':
-        st.markdown(f"<div style='background-color:#d1e7dd;padding:10px;border-radius:5px;'>"
-                    f"<strong>Prediction:</strong> This customer is <span style='color:#0f5132;'>a potential target</span> for the bank offer."
-                    f"</div>", unsafe_allow_html=True)
-    else:
-        st.markdown(f"<div style='background-color:#f8d7da;padding:10px;border-radius:5px;'>"
-                    f"<strong>Prediction:</strong> This customer is <span style='color:#842029;'>not a potential target</span> for the bank offer."
-                    f"</div>", unsafe_allow_html=True)
+single_tab, upload_tab = st.tabs(["Single customer", "Upload CSV"])
+
+with single_tab:
+    st.write("Input customer data to determine customer potential for bank offers!")
+
+    # User inputs
+    age = st.number_input("Age", min_value=17, max_value=100)
+    job = select("Job 💼", 'job')
+    marital = select("Marital Status 💍", 'marital')
+    education = select("Educational Level 🎓🏫", 'education')
+    default = select("Credit in Default?", 'default')
+    housing = select("Has Housing Loan? 🏠", 'housing')
+    loan = select("Has Personal Loan?", 'loan')
+    contact = select("Contact Communication Type 📞", 'contact')
+    month = select("Last Contact Month", 'month')
+    day_of_week = select("Last Contact Day of the Week", 'day_of_week')
+    duration = st.number_input("Last Contact Duration (seconds)", min_value=0)
+    campaign = st.number_input("Number of Contacts During Campaign", min_value=0)
+    pdays = st.number_input("Days Since Last Contact", min_value=0, max_value=999)
+    previous = st.number_input("Previous Contact Count ⏮️", min_value=0)
+    poutcome = select("Outcome of Previous Campaign", 'poutcome')
+
+    if st.button("Predict"):
+        input_data = pd.DataFrame({
+            'age': [age],
+            'job': [job],
+            'marital': [marital],
+            'education': [education],
+            'default': [default],
+            'housing': [housing],
+            'loan': [loan],
+            'contact': [contact],
+            'month': [month],
+            'day_of_week': [day_of_week],
+            'duration': [duration],
+            'campaign': [campaign],
+            'pdays': [pdays],
+            'previous': [previous],
+            'poutcome': [poutcome]
+        })
+
+        prediction, probability = predict(input_data)
+
+        if prediction == 'yes':
+            st.markdown(f"<div style='background-color:#d1e7dd;padding:10px;border-radius:5px;'>"
+                        f"<strong>Prediction:</strong> This customer is <span style='color:#0f5132;'>a potential target</span> for the bank offer."
+                        f"</div>", unsafe_allow_html=True)
+        else:
+            st.markdown(f"<div style='background-color:#f8d7da;padding:10px;border-radius:5px;'>"
+                        f"<strong>Prediction:</strong> This customer is <span style='color:#842029;'>not a potential target</span> for the bank offer."
+                        f"</div>", unsafe_allow_html=True)
+        st.caption(f"Probability of subscribing: {probability:.1%}")
+
+        with st.expander("Why this prediction?"):
+            explanation = explain(input_data)
+            st.write(f"Average probability over the training data: {explanation['bias']:.1%}. "
+                     "Each bar is how much a field moved this customer's probability up or down from it.")
+            contributions = pd.Series(explanation['contributions'], name='contribution')
+            st.bar_chart(contributions.sort_values(key=abs, ascending=False))
+
+with upload_tab:
+    st.write("Upload a CSV with the columns of bank_marketing_data.csv to score every customer in it.")
+    uploaded = st.file_uploader("Customers CSV", type='csv')
+
+    if uploaded is not None:
+        # Scored once per file and model version; later reruns (e.g. the download click) reuse the result
+        upload_key = (uploaded.file_id, model_version)
+        if st.session_state.get('upload_key') != upload_key:
+            data = pd.read_csv(uploaded)
+            missing = [col for col in INPUT_COLUMNS if col not in data.columns]
+            if missing:
+                st.error(f"Missing columns: {', '.join(missing)}")
+                st.stop()
+            scored = score_upload(data, st.progress(0.0, text="Scoring..."))
+            st.session_state['upload_key'] = upload_key
+            st.session_state['upload_scored'] = scored
+            st.session_state['upload_csv'] = scored.to_csv(index=False).encode('utf-8')
+        scored = st.session_state['upload_scored']
+
+        valid = scored['error'].isna()
+        customers, targets, invalid = st.columns(3)
+        customers.metric("Customers", f"{len(scored):,}")
+        targets.metric("Potential targets", f"{int((scored['prediction'] == 'yes').sum()):,}")
+        invalid.metric("Invalid rows", f"{int((~valid).sum()):,}")
+
+        st.write("Probability of subscribing")
+        counts, edges = np.histogram(scored.loc[valid, 'probability'], bins=20, range=(0.0, 1.0))
+        st.bar_chart(pd.DataFrame({'customers': counts}, index=[f"{edge:.2f}" for edge in edges[:-1]]))
+
+        st.write("Most likely customers")
+        st.dataframe(scored[valid].nlargest(100, 'probability'), hide_index=True)
+        if not valid.all():
+            st.write("Invalid rows")
+            st.dataframe(scored[~valid].head(100))
+
+        st.download_button("Download scored CSV", st.session_state['upload_csv'],
+                           file_name=f"scored_{uploaded.name}", mime='text/csv')
 
 # how to run
 # python -m streamlit run prediction_streamlit.py
@@ -0,0 +1,51 @@
+import heapq
+
+import numpy as np
+
+# Class whose probability scores and ranks leads
+POSITIVE_CLASS = 'yes'
+
+
+class TopK:
+    """Keeps the k highest-probability candidates seen so far, in O(k) memory.
+
+    Candidates arrive in chunks as (probabilities, ids) arrays. Each chunk is first
+    cut down with NumPy (threshold, current k-th best, the chunk's own top k) so only
+    real contenders reach the heap. Ties keep the candidate that arrived first.
+    """
+
+    def __init__(self, k, threshold=None):
+        if k <= 0:
+            raise ValueError("k must be positive")
+        self.k = k
+        self.threshold = threshold
+        self.heap = []
+        self.seen = 0
+
+    def push(self, probabilities, ids):
+        probabilities = np.asarray(probabilities, dtype=np.float64)
+        order = np.arange(self.seen, self.seen + len(probabilities))
+        self.seen += len(probabilities)
+
+        keep = np.ones(len(probabilities), dtype=bool)
+        if self.threshold is not None:
+            keep &= probabilities >= self.threshold
+        if len(self.heap) == self.k:
+            keep &= probabilities > self.heap[0][0]
+        candidates = np.flatnonzero(keep)
+        if len(candidates) > self.k:
+            # A stable sort keeps the earliest of equally likely candidates
+            best = np.argsort(-probabilities[candidates], kind='stable')[:self.k]
+            candidates = np.sort(candidates[best])
+
+        for i in candidates:
+            # Heap entries are (probability, -arrival order, id): the root is the weakest, latest-arriving one
+            entry = (float(probabilities[i]), -int(order[i]), ids[i])
+            if len(self.heap) < self.k:
+                heapq.heappush(self.heap, entry)
+            elif entry[:2] > self.heap[0][:2]:
+                heapq.heapreplace(self.heap, entry)
+
+    def results(self):
+        """[(id, probability)] from the most to the least likely."""
+        return [(entry[2], entry[0]) for entry in sorted(self.heap, key=lambda entry: entry[:2], reverse=True)]
@@ -0,0 +1,180 @@
+import argparse
+import collections
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from columnar_dataset import ColumnarDataset
+from feature_encoder import INPUT_COLUMNS
+from model_bundle import DEFAULT_BUNDLE_PATH, load_bundle
+from ranking import POSITIVE_CLASS, TopK
+from schemas import format_error_detail, validate_columns
+
+OUTPUT_COLUMNS = ['id', 'prediction', 'probability', 'error']
+RANKING_COLUMNS = ['rank', 'id', 'probability']
+
+
+def read_chunks(path, chunk_size, columns):
+    """Yield DataFrames of at most chunk_size rows from a CSV or Parquet file or a columnar dataset directory."""
+    if ColumnarDataset.is_dataset(path):
+        # Compact frames: categorical columns stay dictionary-encoded and numbers come straight from the map
+        yield from ColumnarDataset(path).iter_frames(chunk_size, columns)
+    elif path.endswith('.parquet'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("Reading Parquet files requires pyarrow (pip install pyarrow)")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=columns):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size, usecols=columns)
+
+
+class ResultWriter:
+    """Appends scored chunks to a CSV or Parquet file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.parquet_writer = None
+        self.header_written = False
+
+    def write(self, result):
+        if self.path.endswith('.parquet'):
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pandas(result, preserve_index=False)
+            if self.parquet_writer is None:
+                self.parquet_writer = pq.ParquetWriter(self.path, table.schema)
+            self.parquet_writer.write_table(table)
+        else:
+            result.to_csv(self.path, mode='a' if self.header_written else 'w', header=not self.header_written, index=False)
+            self.header_written = True
+
+    def close(self):
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+
+
+def column_values(series):
+    """A frame column as validate_columns takes it: a Categorical stays dictionary-encoded, anything else a NumPy array.
+
+    Nullable integers (compact dataset frames) become float with NaN where a value is missing,
+    as pd.read_csv gives them, so validation reports the same errors as for the CSV.
+    """
+    values = series.array
+    if isinstance(values, pd.Categorical):
+        return values
+    if isinstance(values, pd.arrays.IntegerArray):
+        if values.isna().any():
+            return values.to_numpy(dtype=np.float64, na_value=np.nan)
+        return values.to_numpy(dtype=values.dtype.numpy_dtype)
+    return series.to_numpy()
+
+
+def score_frame(model, encoder, frame, ids):
+    """Validate, encode and predict one chunk; invalid rows get an error message instead of a prediction."""
+    columns = {name: column_values(frame[name]) for name in INPUT_COLUMNS}
+    valid_index, valid_columns, errors = validate_columns(columns, len(frame))
+
+    prediction = np.full(len(frame), None, dtype=object)
+    probability = np.full(len(frame), np.nan)
+    error = np.full(len(frame), None, dtype=object)
+    if len(valid_index):
+        proba = model.predict_proba(encoder.to_frame(encoder.encode_columns(valid_columns, len(valid_index))))
+        prediction[valid_index] = model.classes_.take(np.argmax(proba, axis=1))
+        probability[valid_index] = proba[:, list(model.classes_).index(POSITIVE_CLASS)]
+    for entry in errors:
+        error[entry['index']] = format_error_detail(entry['detail'])
+    return pd.DataFrame({'id': ids, 'prediction': prediction, 'probability': probability, 'error': error},
+                        columns=OUTPUT_COLUMNS)
+
+
+def score_chunk(bundle_path, frame, ids):
+    bundle = load_bundle(bundle_path)
+    return score_frame(bundle.model, bundle.encoder, frame, ids)
+
+
+def ordered_map(executor, fn, argument_tuples, window):
+    """Like executor.map, but with at most `window` chunks in flight, so memory stays bounded."""
+    pending = collections.deque()
+    for arguments in argument_tuples:
+        pending.append(executor.submit(fn, *arguments))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def score_file(input_path, output_path, bundle_path=DEFAULT_BUNDLE_PATH, chunk_size=50000, workers=1,
+               id_column=None, top_k=None, threshold=None, report=sys.stderr):
+    """Score input_path chunk by chunk into output_path.
+
+    With `top_k`, only the k most likely subscribers (at or above `threshold`, if given) are
+    kept in a bounded heap across chunks and written once at the end, best first.
+    """
+    columns = INPUT_COLUMNS + ([id_column] if id_column else [])
+
+    def chunks_with_ids():
+        offset = 0
+        for frame in read_chunks(input_path, chunk_size, columns):
+            ids = np.asarray(column_values(frame[id_column])) if id_column else np.arange(offset, offset + len(frame))
+            offset += len(frame)
+            yield bundle_path, frame, ids
+
+    writer = ResultWriter(output_path)
+    top = TopK(top_k, threshold) if top_k else None
+    start = time.perf_counter()
+    n_rows = n_errors = 0
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        if executor is None:
+            results = (score_chunk(*arguments) for arguments in chunks_with_ids())
+        else:
+            results = ordered_map(executor, score_chunk, chunks_with_ids(), window=2 * workers)
+        for result in results:
+            if top is None:
+                writer.write(result)
+            else:
+                valid = result[result['error'].isna()]
+                top.push(valid['probability'].to_numpy(), valid['id'].to_numpy())
+            n_rows += len(result)
+            n_errors += int(result['error'].notna().sum())
+            elapsed = time.perf_counter() - start
+            print(f"{n_rows} rows scored, {n_errors} invalid, {n_rows / elapsed:,.0f} rows/s", file=report)
+        if top is not None:
+            ranking = top.results()
+            writer.write(pd.DataFrame({'rank': np.arange(1, len(ranking) + 1),
+                                       'id': [lead_id for lead_id, _ in ranking],
+                                       'probability': [probability for _, probability in ranking]},
+                                      columns=RANKING_COLUMNS))
+    finally:
+        writer.close()
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    elapsed = time.perf_counter() - start
+    print(f"Done: {n_rows} rows in {elapsed:.2f} s ({n_rows / max(elapsed, 1e-9):,.0f} rows/s), "
+          f"{n_errors} invalid rows, written to {output_path}", file=report)
+    return n_rows, n_errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score a CSV or Parquet file of customers in bounded-memory chunks.")
+    parser.add_argument('input', help="CSV or .parquet file with the columns of bank_marketing_data.csv, "
+                                      "or a dataset directory written by columnar_dataset.py")
+    parser.add_argument('output', help="Output CSV or .parquet file (id, prediction, probability, error)")
+    parser.add_argument('--bundle', default=DEFAULT_BUNDLE_PATH, help="Model bundle built by model_bundle.py")
+    parser.add_argument('--chunk-size', type=int, default=50000)
+    parser.add_argument('--workers', type=int, default=1, help="Processes scoring chunks in parallel")
+    parser.add_argument('--id-column', default=None, help="Input column to use as row id (default: row number)")
+    parser.add_argument('--top-k', type=int, default=None,
+                        help="Only write the k most likely subscribers (rank, id, probability)")
+    parser.add_argument('--threshold', type=float, default=None, help="With --top-k, minimum probability to rank")
+    args = parser.parse_args()
+
+    score_file(args.input, args.output, bundle_path=args.bundle, chunk_size=args.chunk_size,
+               workers=args.workers, id_column=args.id_column, top_k=args.top_k, threshold=args.threshold)
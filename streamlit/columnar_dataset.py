@@ -0,0 +1,271 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from model_bundle import DEFAULT_BUNDLE_PATH, load_bundle
+
+# Layout: a directory holding meta.json and one raw little-endian file per column, read back with
+# np.memmap, so opening a dataset and taking a column copies nothing.
+# Categorical columns hold int codes into a dictionary that starts with the training vocabulary
+# (values first seen in the data are appended after it); -1 marks a missing value, as in pd.Categorical.
+# Integer columns use the narrowest signed dtype that fits, with the dtype's minimum marking a missing value.
+FORMAT_VERSION = 1
+META_FILE = 'meta.json'
+INT_DTYPES = [np.dtype(np.int8), np.dtype(np.int16), np.dtype(np.int32), np.dtype(np.int64)]
+
+
+def dictionaries_from_bundle(bundle):
+    """Starting dictionaries for the categorical columns: the vocabularies the model was trained with."""
+    dictionaries = {field: list(values) for field, values in bundle.vocabularies.items()}
+    dictionaries.update({field: list(mapping) for field, mapping in bundle.categorical_mappings.items()})
+    dictionaries['y'] = list(bundle.metadata['classes'])
+    return dictionaries
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def source_digest(path):
+    """SHA-256 of a CSV file, or of the CSV a dataset directory was converted from."""
+    if ColumnarDataset.is_dataset(path):
+        return ColumnarDataset(path).source_sha256
+    return file_digest(path)
+
+
+def _missing(dtype):
+    return np.iinfo(dtype).min if dtype.kind == 'i' else np.nan
+
+
+def _narrowest_int(values):
+    """Smallest signed integer dtype holding `values` with its minimum left free as the missing marker."""
+    if len(values) == 0:
+        return INT_DTYPES[0]
+    low, high = values.min(), values.max()
+    for dtype in INT_DTYPES:
+        info = np.iinfo(dtype)
+        if info.min < low and high <= info.max:
+            return dtype
+    raise ValueError(f"Values out of the int64 range: {low}..{high}")
+
+
+def _storage(values):
+    """Storage dtype and array for one chunk of a numeric column."""
+    values = np.asarray(values)
+    if values.dtype.kind in 'iub':
+        dtype = _narrowest_int(values)
+        return dtype, values.astype(dtype)
+    missing = np.isnan(values)
+    present = values[~missing]
+    if np.array_equal(present, np.round(present)) and (len(present) == 0 or np.abs(present).max() < 2 ** 62):
+        dtype = _narrowest_int(present.astype(np.int64))
+        stored = np.where(missing, 0, values).astype(dtype)
+        stored[missing] = _missing(dtype)
+        return dtype, stored
+    # Genuinely fractional values: float32 only when it holds every value exactly
+    if np.array_equal(values.astype(np.float32).astype(np.float64), values, equal_nan=True):
+        return np.dtype(np.float32), values.astype(np.float32)
+    return np.dtype(np.float64), values.astype(np.float64)
+
+
+class _ColumnWriter:
+    """Appends chunks to a raw column file, rewriting it once with a wider dtype when a chunk needs one."""
+
+    def __init__(self, path, categorical):
+        self.path = path
+        self.categorical = categorical
+        self.dtype = None
+        self.length = 0
+        open(path, 'wb').close()
+
+    def append(self, dtype, values):
+        if self.dtype is not None and np.promote_types(self.dtype, dtype) != self.dtype:
+            self._widen(np.promote_types(self.dtype, dtype))
+        if self.dtype is None:
+            self.dtype = dtype
+        stored = values.astype(self.dtype)
+        if not self.categorical and dtype.kind == 'i':
+            stored[values == _missing(dtype)] = _missing(self.dtype)
+        with open(self.path, 'ab') as f:
+            stored.astype(self.dtype.newbyteorder('<')).tofile(f)
+        self.length += len(values)
+
+    def _widen(self, dtype):
+        old = np.fromfile(self.path, dtype=self.dtype.newbyteorder('<'))
+        widened = old.astype(dtype)
+        # Categorical codes keep -1 as missing; numeric columns move the marker to the new dtype's
+        if not self.categorical and self.dtype.kind == 'i':
+            widened[old == _missing(self.dtype)] = _missing(dtype)
+        widened.astype(dtype.newbyteorder('<')).tofile(self.path)
+        self.dtype = dtype
+
+
+def convert(csv_path, output_path, dictionaries, chunk_size=1000000, report=sys.stderr):
+    """Write csv_path as a columnar dataset directory at output_path (replaced once complete)."""
+    tmp_path = f"{output_path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    writers, source_dtypes, categories = {}, {}, {}
+    n_rows = 0
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_size):
+        for i, name in enumerate(chunk.columns):
+            values = chunk[name]
+            if name not in writers:
+                categorical = name in dictionaries or values.dtype == object
+                writers[name] = _ColumnWriter(os.path.join(tmp_path, f"{i}.col"), categorical)
+                categories[name] = list(dictionaries.get(name, []))
+            source_dtypes[name] = np.result_type(source_dtypes.get(name, values.dtype), values.dtype)
+            if writers[name].categorical:
+                codes = pd.Index(categories[name]).get_indexer(values)
+                new_values = values[(codes < 0) & values.notna()].unique()
+                if len(new_values):
+                    categories[name].extend(new_values.tolist())
+                    codes = pd.Index(categories[name]).get_indexer(values)
+                dtype = _narrowest_int(np.array([len(categories[name])]))
+                writers[name].append(dtype, codes)
+            else:
+                writers[name].append(*_storage(values.to_numpy()))
+        n_rows += len(chunk)
+        print(f"{n_rows} rows converted", file=report)
+
+    meta = {
+        'format_version': FORMAT_VERSION,
+        'source': os.path.basename(csv_path),
+        'source_sha256': file_digest(csv_path),
+        'n_rows': n_rows,
+        'columns': [{'name': name, 'file': os.path.basename(writer.path), 'dtype': writer.dtype.newbyteorder('<').str,
+                     'source_dtype': source_dtypes[name].str, 'categories': categories[name] if writer.categorical else None}
+                    for name, writer in writers.items()],
+    }
+    with open(os.path.join(tmp_path, META_FILE), 'w') as f:
+        json.dump(meta, f, indent=1)
+    shutil.rmtree(output_path, ignore_errors=True)
+    os.replace(tmp_path, output_path)
+    return ColumnarDataset(output_path)
+
+
+class ColumnarDataset:
+    """Read side of a dataset directory written by `convert`.
+
+    `values` returns a column's read-only memory-mapped array (no copy); `frame` and
+    `iter_frames` build DataFrames from them, either compact (pd.Categorical columns,
+    nullable narrow ints) or `like_csv` (the dtypes pd.read_csv gives for the source file).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as f:
+            self.meta = json.load(f)
+        if self.meta['format_version'] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported dataset format version {self.meta['format_version']}")
+        self.column_meta = {column['name']: column for column in self.meta['columns']}
+
+    @staticmethod
+    def is_dataset(path):
+        return os.path.isfile(os.path.join(path, META_FILE))
+
+    @property
+    def n_rows(self):
+        return self.meta['n_rows']
+
+    @property
+    def columns(self):
+        return list(self.column_meta)
+
+    @property
+    def source_sha256(self):
+        return self.meta['source_sha256']
+
+    def categories(self, name):
+        return self.column_meta[name]['categories']
+
+    def values(self, name):
+        """The stored array of a column: codes for categorical columns, numbers (with missing markers) otherwise."""
+        column = self.column_meta[name]
+        if self.n_rows == 0:
+            return np.empty(0, dtype=column['dtype'])
+        return np.memmap(os.path.join(self.path, column['file']), dtype=column['dtype'], mode='r', shape=(self.n_rows,))
+
+    def nbytes(self):
+        return sum(os.path.getsize(os.path.join(self.path, column['file'])) for column in self.meta['columns'])
+
+    def series(self, name, start=0, stop=None, like_csv=False):
+        column = self.column_meta[name]
+        stored = self.values(name)[start:stop]
+        if column['categories'] is not None:
+            if like_csv:
+                categories = np.asarray(column['categories'] + [np.nan], dtype=object)
+                return pd.Series(categories[stored], name=name)
+            return pd.Series(pd.Categorical.from_codes(stored, column['categories']), name=name)
+        if stored.dtype.kind == 'f':
+            return pd.Series(stored.astype(column['source_dtype']) if like_csv else stored, name=name)
+        missing = stored == _missing(stored.dtype)
+        if like_csv:
+            values = stored.astype(column['source_dtype'])
+            if missing.any():
+                values[missing] = np.nan
+            return pd.Series(values, name=name)
+        return pd.Series(pd.arrays.IntegerArray(np.asarray(stored), missing), name=name)
+
+    def frame(self, columns=None, start=0, stop=None, like_csv=False):
+        columns = self.columns if columns is None else columns
+        return pd.concat([self.series(name, start, stop, like_csv) for name in columns], axis=1)
+
+    def iter_frames(self, chunk_size, columns=None, like_csv=False):
+        for start in range(0, self.n_rows, chunk_size):
+            yield self.frame(columns, start, start + chunk_size, like_csv)
+
+
+def read_frame(path, columns=None):
+    """A CSV file or a dataset directory as the DataFrame pd.read_csv would give for the source CSV.
+
+    For train.py, whose cached stages are keyed by the source CSV's digest and so must see exactly
+    the CSV's frame; scoring reads compact frames (see batch_score.read_chunks).
+    """
+    if ColumnarDataset.is_dataset(path):
+        return ColumnarDataset(path).frame(columns, like_csv=True)
+    return pd.read_csv(path, usecols=columns)
+
+
+def compare(csv_path, dataset, report=sys.stderr):
+    """Load time and memory of the CSV path against the dataset, compact and like_csv."""
+    start = time.perf_counter()
+    csv_frame = pd.read_csv(csv_path)
+    csv_seconds = time.perf_counter() - start
+    results = [{'path': 'csv', 'seconds': csv_seconds, 'disk_bytes': os.path.getsize(csv_path),
+                'memory_bytes': int(csv_frame.memory_usage(deep=True).sum())}]
+    for like_csv in (False, True):
+        start = time.perf_counter()
+        frame = ColumnarDataset(dataset.path).frame(like_csv=like_csv)
+        results.append({'path': 'dataset (like_csv)' if like_csv else 'dataset', 'seconds': time.perf_counter() - start,
+                        'disk_bytes': dataset.nbytes(), 'memory_bytes': int(frame.memory_usage(deep=True).sum())})
+    for result in results:
+        print(f"{result['path']:<20} load {result['seconds'] * 1000:>9.1f} ms ({csv_seconds / result['seconds']:>5.1f}x)  "
+              f"memory {result['memory_bytes']:>13,} B ({csv_frame.memory_usage(deep=True).sum() / result['memory_bytes']:>5.1f}x)  "
+              f"disk {result['disk_bytes']:>13,} B", file=report)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a CSV of customers into a memory-mapped columnar dataset.")
+    parser.add_argument('input', help="CSV file, e.g. bank_marketing_data.csv")
+    parser.add_argument('output', help="Dataset directory to write, e.g. bank_marketing_data.cols")
+    parser.add_argument('--bundle', default=DEFAULT_BUNDLE_PATH, help="Bundle whose vocabularies seed the dictionaries")
+    parser.add_argument('--chunk-size', type=int, default=1000000)
+    args = parser.parse_args()
+
+    dataset = convert(args.input, args.output, dictionaries_from_bundle(load_bundle(args.bundle)), args.chunk_size)
+    print(f"Wrote {args.output}: {dataset.n_rows} rows, {len(dataset.columns)} columns", file=sys.stderr)
+    compare(args.input, dataset)
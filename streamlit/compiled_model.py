@@ -0,0 +1,161 @@
+import argparse
+
+import numpy as np
+
+# Rows walked through the trees at once, bounds the (rows, estimators) work arrays
+PREDICT_CHUNK_SIZE = 65536
+
+
+class CompiledForest:
+    """Array form of the BaggingClassifier of DecisionTrees in Bagging_dt.pkl.
+
+    Every tree's nodes are concatenated into flat arrays; features are already
+    mapped through `estimators_features_` and leaves point to themselves, so a
+    batch is scored by stepping all (row, estimator) pairs `max_depth` times.
+    Leaf probabilities and the estimator average are computed with the same
+    float operations, in the same order, as sklearn, so results are bit-identical.
+    """
+
+    def __init__(self, feature, threshold, left, right, leaf_proba, roots, classes, feature_names, max_depth):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.leaf_proba = leaf_proba
+        self.roots = roots
+        self.classes_ = classes
+        self.feature_names_in_ = feature_names
+        self.max_depth = int(max_depth)
+
+    @property
+    def n_estimators(self):
+        return len(self.roots)
+
+    @property
+    def n_features_in_(self):
+        return len(self.feature_names_in_)
+
+    @classmethod
+    def from_sklearn(cls, model):
+        features, thresholds, lefts, rights, leaf_probas, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator, estimator_features in zip(model.estimators_, model.estimators_features_):
+            tree = estimator.tree_
+            is_leaf = tree.children_left == -1
+            node_ids = np.arange(tree.node_count)
+
+            features.append(np.where(is_leaf, 0, np.asarray(estimator_features)[np.maximum(tree.feature, 0)]))
+            thresholds.append(np.where(is_leaf, 0.0, tree.threshold))
+            lefts.append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+            rights.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+
+            # DecisionTreeClassifier.predict_proba: leaf class counts divided by their sum
+            proba = tree.value[:, 0, :len(model.classes_)].copy()
+            normalizer = proba.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            proba /= normalizer
+            leaf_probas.append(proba)
+
+            roots.append(offset)
+            offset += tree.node_count
+            max_depth = max(max_depth, tree.max_depth)
+
+        return cls(feature=np.concatenate(features).astype(np.intp),
+                   threshold=np.concatenate(thresholds).astype(np.float64),
+                   left=np.concatenate(lefts).astype(np.intp),
+                   right=np.concatenate(rights).astype(np.intp),
+                   leaf_proba=np.concatenate(leaf_probas),
+                   roots=np.asarray(roots, dtype=np.intp),
+                   classes=np.asarray(model.classes_),
+                   feature_names=np.asarray(model.feature_names_in_, dtype=object),
+                   max_depth=max_depth)
+
+    def save(self, path):
+        np.savez(path, feature=self.feature, threshold=self.threshold, left=self.left, right=self.right,
+                 leaf_proba=self.leaf_proba, roots=self.roots, classes=self.classes_.astype(str),
+                 feature_names=self.feature_names_in_.astype(str), max_depth=self.max_depth)
+
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        with np.load(path, mmap_mode=mmap_mode) as arrays:
+            return cls(feature=arrays['feature'].astype(np.intp, copy=False),
+                       threshold=arrays['threshold'],
+                       left=arrays['left'].astype(np.intp, copy=False),
+                       right=arrays['right'].astype(np.intp, copy=False),
+                       leaf_proba=arrays['leaf_proba'],
+                       roots=arrays['roots'].astype(np.intp, copy=False),
+                       classes=arrays['classes'].astype(object),
+                       feature_names=arrays['feature_names'].astype(object),
+                       max_depth=arrays['max_depth'])
+
+    def apply(self, X):
+        """Global leaf index reached by every row in every estimator, shape (n_rows, n_estimators)."""
+        # Trees split on float32 features, like sklearn's DecisionTree
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"X has {X.shape[-1]} features, but the model is expecting {self.n_features_in_} features")
+        rows = np.arange(X.shape[0])[:, np.newaxis]
+        node = np.broadcast_to(self.roots, (X.shape[0], self.n_estimators))
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(go_left, self.left[node], self.right[node])
+        return node
+
+    def predict_proba(self, X):
+        X = np.asarray(X)
+        proba = np.empty((X.shape[0], len(self.classes_)), dtype=np.float64)
+        for start in range(0, X.shape[0], PREDICT_CHUNK_SIZE):
+            leaves = self.apply(X[start:start + PREDICT_CHUNK_SIZE])
+            # Accumulate estimator by estimator, as BaggingClassifier does
+            chunk_proba = np.zeros((leaves.shape[0], len(self.classes_)), dtype=np.float64)
+            for estimator in range(self.n_estimators):
+                chunk_proba += self.leaf_proba[leaves[:, estimator]]
+            proba[start:start + PREDICT_CHUNK_SIZE] = chunk_proba / self.n_estimators
+        return proba
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+
+
+def verify(model, compiled, features):
+    """Raise AssertionError unless `compiled` reproduces `model` exactly on `features`."""
+    expected_proba = model.predict_proba(features)
+    actual_proba = compiled.predict_proba(np.asarray(features))
+    mismatched = np.count_nonzero(np.any(expected_proba != actual_proba, axis=1))
+    assert mismatched == 0, f"{mismatched} rows have different probabilities"
+    assert np.array_equal(model.predict(features), compiled.predict(np.asarray(features))), "Predictions differ"
+
+
+def load_reference_features(encoder, csv_path='bank_marketing_data.csv'):
+    """Encoded rows of bank_marketing_data.csv, cleaned the way modelling.ipynb cleans the training data."""
+    import pandas as pd
+
+    data = pd.read_csv(csv_path)
+    data['job'] = data['job'].str.replace('.', '').fillna('admin')
+    data['duration'] = data['duration'].fillna(180)
+    return encoder.to_frame(encoder.encode_frame(data))
+
+
+if __name__ == "__main__":
+    import joblib
+
+    from feature_encoder import FeatureEncoder
+
+    parser = argparse.ArgumentParser(description="Compile Bagging_dt.pkl into flat arrays and check parity with sklearn.")
+    parser.add_argument('--model', default='Bagging_dt.pkl')
+    parser.add_argument('--output', default='Bagging_dt.npz')
+    parser.add_argument('--data', default='bank_marketing_data.csv', help="CSV used for the parity check")
+    args = parser.parse_args()
+
+    model = joblib.load(args.model)
+    compiled = CompiledForest.from_sklearn(model)
+    encoder = FeatureEncoder.from_artifacts(model, joblib.load('mappings.pkl'), joblib.load('standard_scaler.pkl'),
+                                            joblib.load('job_train_unique.pkl'), joblib.load('education_train_unique.pkl'),
+                                            joblib.load('marital_train_unique.pkl'), joblib.load('month_train_unique.pkl'),
+                                            joblib.load('dow_train_unique.pkl'))
+    features = load_reference_features(encoder, args.data)
+    compiled.save(args.output)
+    verify(model, CompiledForest.load(args.output), features)
+    print(f"Compiled {compiled.n_estimators} estimators ({len(compiled.feature)} nodes) to {args.output}; "
+          f"identical to {args.model} on {len(features)} rows of {args.data}")
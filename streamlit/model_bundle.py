@@ -0,0 +1,234 @@
+import argparse
+import functools
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from compiled_model import CompiledForest
+from feature_encoder import FeatureEncoder
+
+# File layout: MAGIC | header length (uint64, little endian) | JSON header | padding | array data.
+# Every array starts on an ALIGNMENT boundary so it can be used in place from a read-only memory map,
+# which lets all worker processes on a host share the same physical pages.
+MAGIC = b'BANKMDL\x00'
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+DEFAULT_BUNDLE_PATH = 'bank_marketing.bundle'
+
+# Written by train.py after all the artifacts it lists: {"version": ..., "files": {name: SHA-256}}
+MANIFEST_NAME = 'artifacts_manifest.json'
+
+# Arrays of the compiled ensemble plus the scaler parameters
+ARRAY_NAMES = ['feature', 'threshold', 'left', 'right', 'leaf_proba', 'roots', 'scaler_mean', 'scaler_scale']
+
+
+class BundleError(ValueError):
+    pass
+
+
+def _padding(position):
+    return -position % ALIGNMENT
+
+
+def _checksum(data, metadata):
+    digest = hashlib.sha256(json.dumps(metadata, sort_keys=True).encode())
+    digest.update(data)
+    return digest.hexdigest()
+
+
+class ModelBundle:
+    """Everything the front-ends need to score: compiled model, encoder inputs and vocabularies.
+
+    `model` and `encoder` are built on first access from arrays that stay memory-mapped.
+    `version` identifies the bundle contents and changes whenever any artifact changes.
+    """
+
+    def __init__(self, arrays, metadata, version, checksum, path=None):
+        self.arrays = arrays
+        self.metadata = metadata
+        self.version = version
+        self.checksum = checksum
+        self.path = path
+
+    @property
+    def feature_names(self):
+        return self.metadata['feature_names']
+
+    @property
+    def vocabularies(self):
+        return self.metadata['vocabularies']
+
+    @property
+    def categorical_mappings(self):
+        return self.metadata['categorical_mappings']
+
+    @functools.cached_property
+    def model(self):
+        return CompiledForest(feature=self.arrays['feature'], threshold=self.arrays['threshold'],
+                              left=self.arrays['left'], right=self.arrays['right'],
+                              leaf_proba=self.arrays['leaf_proba'], roots=self.arrays['roots'],
+                              classes=np.asarray(self.metadata['classes'], dtype=object),
+                              feature_names=np.asarray(self.feature_names, dtype=object),
+                              max_depth=self.metadata['max_depth'])
+
+    @functools.cached_property
+    def encoder(self):
+        return FeatureEncoder(self.feature_names, self.vocabularies, self.categorical_mappings,
+                              self.arrays['scaler_mean'], self.arrays['scaler_scale'],
+                              num_cols=self.metadata['num_cols'])
+
+    @classmethod
+    def from_artifacts(cls, model, mappings, scaler, job_train_unique, education_train_unique,
+                       marital_train_unique, month_train_unique, dow_train_unique, version=None):
+        compiled = CompiledForest.from_sklearn(model)
+        arrays = {'feature': compiled.feature, 'threshold': compiled.threshold, 'left': compiled.left,
+                  'right': compiled.right, 'leaf_proba': compiled.leaf_proba, 'roots': compiled.roots,
+                  'scaler_mean': np.asarray(scaler.mean_, dtype=np.float64),
+                  'scaler_scale': np.asarray(scaler.scale_, dtype=np.float64)}
+        arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+        metadata = {
+            'feature_names': [str(name) for name in model.feature_names_in_],
+            'classes': [str(label) for label in model.classes_],
+            'max_depth': compiled.max_depth,
+            'num_cols': [str(col) for col in scaler.feature_names_in_],
+            'categorical_mappings': mappings['categorical_mappings'],
+            'vocabularies': {field: [str(value) for value in values] for field, values in [
+                ('job', job_train_unique), ('marital', marital_train_unique), ('education', education_train_unique),
+                ('month', month_train_unique), ('day_of_week', dow_train_unique)]},
+        }
+        checksum = _checksum(b''.join(arrays[name].tobytes() for name in ARRAY_NAMES), metadata)
+        return cls(arrays, metadata, version or checksum[:12], checksum)
+
+    @classmethod
+    def from_pickles(cls, directory='.', version=None):
+        import joblib
+
+        def load(name):
+            return joblib.load(os.path.join(directory, name))
+
+        return cls.from_artifacts(load('Bagging_dt.pkl'), load('mappings.pkl'), load('standard_scaler.pkl'),
+                                  load('job_train_unique.pkl'), load('education_train_unique.pkl'),
+                                  load('marital_train_unique.pkl'), load('month_train_unique.pkl'),
+                                  load('dow_train_unique.pkl'), version=version)
+
+    def save(self, path):
+        """Write the bundle to `path` atomically (write to a temporary file, then rename)."""
+        layout = {}
+        offset = 0
+        for name in ARRAY_NAMES:
+            array = self.arrays[name]
+            offset += _padding(offset)
+            layout[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+            offset += array.nbytes
+        header = json.dumps({'format_version': FORMAT_VERSION, 'version': self.version, 'checksum': self.checksum,
+                             'arrays': layout, 'metadata': self.metadata}).encode()
+        data_start = len(MAGIC) + 8 + len(header)
+        data_start += _padding(data_start)
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(len(header).to_bytes(8, 'little'))
+            f.write(header)
+            f.write(b'\x00' * (data_start - f.tell()))
+            for name in ARRAY_NAMES:
+                f.write(b'\x00' * (data_start + layout[name]['offset'] - f.tell()))
+                f.write(self.arrays[name].tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        self.path = path
+
+    @classmethod
+    def open(cls, path, verify=True):
+        """Map a bundle file read-only. With `verify`, the stored checksum is recomputed first."""
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise BundleError(f"{path} is not a model bundle")
+            header = json.loads(f.read(int.from_bytes(f.read(8), 'little')))
+            data_start = f.tell() + _padding(f.tell())
+        if header['format_version'] != FORMAT_VERSION:
+            raise BundleError(f"{path} has bundle format {header['format_version']}, expected {FORMAT_VERSION}")
+
+        buffer = np.memmap(path, dtype=np.uint8, mode='r')
+        arrays = {}
+        for name, spec in header['arrays'].items():
+            arrays[name] = np.ndarray(tuple(spec['shape']), dtype=np.dtype(spec['dtype']), buffer=buffer,
+                                      offset=data_start + spec['offset'])
+
+        if verify and _checksum(b''.join(arrays[name].tobytes() for name in ARRAY_NAMES),
+                                header['metadata']) != header['checksum']:
+            raise BundleError(f"Checksum mismatch in {path}")
+        return cls(arrays, header['metadata'], header['version'], header['checksum'], path=path)
+
+
+def file_digest(path):
+    """SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def manifest_path(path):
+    """The artifact manifest that covers `path`: MANIFEST_NAME in the same directory."""
+    return os.path.join(os.path.dirname(path), MANIFEST_NAME)
+
+
+def check_manifest(paths, digests=None):
+    """Raise BundleError if any of `paths` differs from the digest the manifest next to it lists.
+
+    `digests` maps a path to the digest of the contents actually loaded from it (default: the
+    file as it is now). Files without a manifest, or not listed in it, are not checked. train.py
+    renames the manifest into place after every other artifact, so a mix of old and new files
+    never matches it.
+    """
+    manifests = {}
+    for path in paths:
+        manifest_file = manifest_path(path)
+        if manifest_file not in manifests:
+            try:
+                with open(manifest_file) as f:
+                    manifests[manifest_file] = json.load(f)['files']
+            except FileNotFoundError:
+                manifests[manifest_file] = {}
+        expected = manifests[manifest_file].get(os.path.basename(path))
+        if expected is not None and (digests[path] if digests else file_digest(path)) != expected:
+            raise BundleError(f"{path} does not match {manifest_file}; the artifacts are being replaced")
+
+
+def artifact_version(paths, contents=None):
+    """Version label for artifacts loaded straight from files (e.g. the pickles): a digest of their contents.
+
+    `contents` maps a path to the bytes already read from it; other paths are read from disk.
+    """
+    digest = hashlib.sha256()
+    for path in paths:
+        if contents and path in contents:
+            digest.update(contents[path])
+            continue
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+@functools.lru_cache(maxsize=None)
+def load_bundle(path=DEFAULT_BUNDLE_PATH, verify=True):
+    """Open a bundle once per process; repeated calls (e.g. Streamlit reruns) reuse it."""
+    return ModelBundle.open(path, verify=verify)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert the joblib artifacts into a single memory-mappable model bundle.")
+    parser.add_argument('--artifacts', default='.', help="Directory containing Bagging_dt.pkl and the other pickles")
+    parser.add_argument('--output', default=DEFAULT_BUNDLE_PATH)
+    parser.add_argument('--version', default=None, help="Bundle version label (default: prefix of the content checksum)")
+    args = parser.parse_args()
+
+    bundle = ModelBundle.from_pickles(args.artifacts, version=args.version)
+    bundle.save(args.output)
+    print(f"Wrote {args.output} (version {bundle.version}, {os.path.getsize(args.output)} bytes)")
@@ -0,0 +1,85 @@
+import collections
+import threading
+import time
+
+from feature_encoder import INPUT_COLUMNS
+
+
+def make_key(record):
+    """Canonical, hashable form of a validated record: its field values in INPUT_COLUMNS order."""
+    return tuple(record[col] for col in INPUT_COLUMNS)
+
+
+class PredictionCache:
+    """Bounded LRU cache of predictions with a time-to-live, tied to one model version.
+
+    Records must already be validated and normalized (e.g. `Data(...).model_dump()`), so
+    equivalent inputs map to the same key. Looking up with a different model version
+    than the cached entries were stored under empties the cache first.
+    """
+
+    def __init__(self, max_size=10000, ttl=3600.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = collections.OrderedDict()
+        self.version = None
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _check_version(self, version):
+        if version != self.version:
+            if self.entries:
+                self.invalidations += 1
+            self.entries.clear()
+            self.version = version
+
+    def get(self, record, version):
+        """Cached prediction for `record`, or None."""
+        key = make_key(record)
+        with self.lock:
+            self._check_version(version)
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, record, version, value):
+        key = make_key(record)
+        with self.lock:
+            self._check_version(version)
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "version": self.version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
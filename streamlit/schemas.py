@@ -0,0 +1,217 @@
+import re
+from typing import List
+
+import numpy as np
+import pandas as pd
+from pydantic import AfterValidator, BaseModel, Field, TypeAdapter, ValidationError
+from typing_extensions import Annotated, TypedDict
+
+# Each categorical field has a single after-validator that runs the old per-field checks in their original
+# order (not empty, not the Swagger placeholder "string", allowed characters or values, trailing-character trim),
+# raising the same messages. Numeric bounds are pydantic-core constraints.
+
+BOOLEAN_VALUES = frozenset({'no', 'yes', 'unknown'})
+MARITAL_VALUES = frozenset({'divorced', 'married', 'single', 'unknown'})
+CONTACT_VALUES = frozenset({'cellular', 'telephone'})
+POUTCOME_VALUES = frozenset({'failure', 'nonexistent', 'success'})
+MONTH_VALUES = frozenset({'jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'})
+DAY_OF_WEEK_VALUES = frozenset({'mon', 'tue', 'wed', 'thu', 'fri'})
+
+EDUCATION_CHARS = re.compile(r'[a-z0-9.]*')
+JOB_CHARS = re.compile(r'[a-z.\-]*')
+# To handle inputs that end with a non-alphabetic character, such as 'admin.'
+TRAILING_NON_ALPHA = re.compile(r'[^a-z]+\Z')
+
+
+def _check_not_empty(v):
+    if not v:
+        raise ValueError("Field cannot be empty")
+
+
+def _one_of(values, message):
+    def check(v):
+        _check_not_empty(v)
+        if v not in values:
+            raise ValueError(message)
+        return v
+    return check
+
+
+def _free_text(chars, message):
+    def check(v):
+        _check_not_empty(v)
+        # Prevent the education and job inputs from remaining as "string"
+        if v == 'string':
+            raise ValueError("Field must be filled in accordance")
+        if not chars.fullmatch(v.lower()):
+            raise ValueError(message)
+        return TRAILING_NON_ALPHA.sub('', v)
+    return check
+
+
+def _enum_field(values, message, description):
+    return Annotated[str, AfterValidator(_one_of(values, message)),
+                     Field(description=description, json_schema_extra={'enum': sorted(values)})]
+
+
+Age = Annotated[int, Field(gt=16, le=100, description="Age must be between 17 and 100")]
+Job = Annotated[str, AfterValidator(_free_text(JOB_CHARS, "Job must only contain lowercase letters a-z, dash, and dots. Use dot for space! (e.g. private.chef)")),
+                Field(description="Job must be a string")]
+Marital = _enum_field(MARITAL_VALUES, "Must be 'divorced', 'married', 'single', or 'unknown', If you want to input 'widowed', type 'divorced' instead",
+                      "Marital status must be a string")
+Education = Annotated[str, AfterValidator(_free_text(EDUCATION_CHARS, "Education must only contain lowercase letters a-z, digits, and dots. Use dot for space! (e.g. high.school)")),
+                      Field(description="Education must be a string")]
+Default = _enum_field(BOOLEAN_VALUES, "Must be 'no', 'yes', or 'unknown'", "Default must be 'no', 'yes', or 'unknown'")
+Housing = _enum_field(BOOLEAN_VALUES, "Must be 'no', 'yes', or 'unknown'", "Housing must be 'no', 'yes', or 'unknown'")
+Loan = _enum_field(BOOLEAN_VALUES, "Must be 'no', 'yes', or 'unknown'", "Loan must be 'no', 'yes', or 'unknown'")
+Contact = _enum_field(CONTACT_VALUES, "Must be 'cellular' or 'telephone'", "Contact must be 'cellular' or 'telephone'")
+Month = _enum_field(MONTH_VALUES, "Must be 'jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', or 'dec'",
+                    "Month must be 'jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', or 'dec'")
+DayOfWeek = _enum_field(DAY_OF_WEEK_VALUES, "Must be 'mon', 'tue', 'wed', 'thu', or 'fri'",
+                        "Day must be 'mon', 'tue', 'wed', 'thu', or 'fri'")
+Duration = Annotated[int, Field(ge=0, description="Duration must be a non-negative integer")]
+Campaign = Annotated[int, Field(ge=0, description="Campaign must be a non-negative integer")]
+Pdays = Annotated[int, Field(ge=0, le=999, description="Pdays must be a non-negative integer or 999 if never contacted")]
+Previous = Annotated[int, Field(ge=0, description="Previous must be a non-connegative integer")]
+Poutcome = _enum_field(POUTCOME_VALUES, "Must be 'failure', 'nonexistent', or 'success'",
+                       "Poutcome must be 'failure', 'nonexistent', or 'success'")
+
+
+class Data(BaseModel):
+    age: Age
+    job: Job
+    marital: Marital
+    education: Education
+    default: Default
+    housing: Housing
+    loan: Loan
+    contact: Contact
+    month: Month
+    day_of_week: DayOfWeek
+    duration: Duration
+    campaign: Campaign
+    pdays: Pdays
+    previous: Previous
+    poutcome: Poutcome
+
+
+class DataRecord(TypedDict):
+    """Same fields and rules as Data, validated straight into a plain dict (no model instance, no model_dump() copy)."""
+    age: Age
+    job: Job
+    marital: Marital
+    education: Education
+    default: Default
+    housing: Housing
+    loan: Loan
+    contact: Contact
+    month: Month
+    day_of_week: DayOfWeek
+    duration: Duration
+    campaign: Campaign
+    pdays: Pdays
+    previous: Previous
+    poutcome: Poutcome
+
+
+record_list_adapter = TypeAdapter(List[DataRecord])
+
+# One adapter per field, for validating the distinct values of a column
+field_adapters = {name: TypeAdapter(annotation) for name, annotation in DataRecord.__annotations__.items()}
+
+
+def validate_rows(rows):
+    """Validate raw records so that a bad record only fails itself.
+
+    The whole list is validated in one pydantic-core call; if some rows fail, their
+    errors are split out by index and the remaining rows are validated again.
+    Returns the indices of the valid rows, their normalized values and a list of
+    {"index": i, "detail": [...]} entries for the rows that failed.
+    """
+    try:
+        return list(range(len(rows))), record_list_adapter.validate_python(rows), []
+    except ValidationError as e:
+        details = {}
+        for error in e.errors(include_url=False, include_context=False):
+            index, *loc = error['loc']
+            details.setdefault(index, []).append({**error, 'loc': tuple(loc)})
+
+    valid_index = [i for i in range(len(rows)) if i not in details]
+    valid_rows = record_list_adapter.validate_python([rows[i] for i in valid_index])
+    errors = [{"index": i, "detail": details[i]} for i in sorted(details)]
+    return valid_index, valid_rows, errors
+
+
+def _objects(values):
+    """A column as a 1-D object array of its values, missing categorical values as None."""
+    if isinstance(values, pd.Categorical):
+        return np.append(np.asarray(values.categories, dtype=object), None)[values.codes]
+    if isinstance(values, np.ndarray):
+        # Python ints, floats and strs, as validate_rows would get them from JSON
+        return values.astype(object)
+    # fromiter keeps each value as it is (np.asarray would turn [5, 'a'] into strings, or nested lists into 2-D)
+    return np.fromiter(values, dtype=object, count=len(values))
+
+
+def _validate_column(adapter, values):
+    """(normalized values, invalid mask) for one column, running the field's validator once per distinct value.
+
+    Values are only grouped when the column holds a single type (e.g. all str or all int), so that
+    1, 1.0 and True, which compare equal but do not validate alike, are never merged.
+    """
+    if isinstance(values, pd.Categorical):
+        # Already dictionary-encoded; code -1 (missing) picks the trailing None
+        codes, uniques = values.codes, np.append(np.asarray(values.categories, dtype=object), None)
+    else:
+        values = values if isinstance(values, np.ndarray) else _objects(values)
+        if values.dtype == object and pd.api.types.infer_dtype(values, skipna=False) not in (
+                'string', 'integer', 'floating', 'boolean'):
+            codes, uniques = np.arange(len(values)), values
+        else:
+            codes, uniques = pd.factorize(values, use_na_sentinel=False)
+            uniques = np.asarray(uniques)
+    normalized, invalid = [], np.zeros(len(uniques), dtype=bool)
+    for i, value in enumerate(uniques.tolist()):
+        try:
+            normalized.append(adapter.validate_python(value))
+        except ValidationError:
+            normalized.append(None)
+            invalid[i] = True
+    if all(isinstance(value, str) or value is None for value in normalized):
+        normalized = np.asarray(normalized, dtype=object)
+    else:
+        normalized = np.asarray([0 if value is None else value for value in normalized])
+    return normalized[codes], invalid[codes]
+
+
+def validate_columns(columns, n_rows):
+    """Column-wise counterpart of validate_rows for a mapping of field -> n_rows values (lists or NumPy arrays).
+
+    Accepts, normalizes and rejects exactly what validate_rows does, without building a dict per row:
+    each field's validator runs once per distinct value of the column. Only the rows that fail are
+    turned into records and passed to validate_rows, for its error details. Returns the indices of
+    the valid rows, a mapping of field -> NumPy array of their normalized values, and the errors.
+    """
+    invalid = np.zeros(n_rows, dtype=bool)
+    normalized = {}
+    for name, adapter in field_adapters.items():
+        if name not in columns:
+            invalid[:] = True
+            continue
+        normalized[name], column_invalid = _validate_column(adapter, columns[name])
+        invalid |= column_invalid
+
+    valid_index = np.flatnonzero(~invalid)
+    errors = []
+    if invalid.any():
+        invalid_index = np.flatnonzero(invalid)
+        present = [name for name in field_adapters if name in columns]
+        values = {name: _objects(columns[name])[invalid_index] for name in present}
+        rows = [{name: values[name][i] for name in present} for i in range(len(invalid_index))]
+        errors = [{**error, "index": int(invalid_index[error["index"]])} for error in validate_rows(rows)[2]]
+    return valid_index, {name: values[valid_index] for name, values in normalized.items()}, errors
+
+
+def format_error_detail(detail):
+    """One-line summary of a validate_rows error detail, e.g. "job: Value error, Field cannot be empty"."""
+    return "; ".join(f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in detail)
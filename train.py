@@ -0,0 +1,294 @@
+import argparse
+import hashlib
+import importlib.metadata
+import json
+import os
+import pickle
+import sys
+import time
+
+import joblib
+import numpy as np
+import sklearn
+from sklearn.ensemble import BaggingClassifier
+from sklearn.metrics import classification_report, f1_score, make_scorer
+from sklearn.model_selection import GridSearchCV, train_test_split
+from sklearn.preprocessing import StandardScaler
+from sklearn.tree import DecisionTreeClassifier
+
+from columnar_dataset import read_frame, source_digest
+from compiled_model import CompiledForest, verify
+from feature_encoder import INPUT_COLUMNS, NUM_COLS, ONE_HOT_FIELDS, FeatureEncoder
+from model_bundle import DEFAULT_BUNDLE_PATH, MANIFEST_NAME, ModelBundle, file_digest
+from ranking import POSITIVE_CLASS
+
+# Settings of modelling.ipynb
+DEFAULT_CONFIG = {
+    'test_size': 0.2,
+    'split_seed': 100,
+    'smote_seed': 26,
+    'cv': 5,
+    'tree_seed': 26,
+    'tree_grid': {
+        'criterion': ['gini', 'entropy', 'log_loss'],
+        'max_depth': [2, 4, 6, 8],
+        'min_samples_split': [2, 5, 10],
+        'min_samples_leaf': [1, 2, 4],
+    },
+    'bagging_seed': 42,
+    'bagging_grid': {
+        'n_estimators': [3, 5, 7, 10, 12, 15, 17, 20],
+        'max_samples': [x / 10 for x in range(1, 11)],
+    },
+}
+
+CATEGORICAL_MAPPINGS = {
+    "default": {"no": -1, "unknown": 0, "yes": 1},
+    "housing": {"no": -1, "unknown": 0, "yes": 1},
+    "loan": {"no": -1, "unknown": 0, "yes": 1},
+    "contact": {"cellular": 0, "telephone": 1},
+    "poutcome": {"failure": -1, "nonexistent": 0, "success": 1},
+}
+
+# Order in which the notebook one-hot encodes the fields, which fixes the model's column order
+ENCODING_ORDER = ['month', 'day_of_week', 'job', 'marital', 'education']
+
+VOCABULARY_FILES = {'job': 'job_train_unique.pkl', 'education': 'education_train_unique.pkl',
+                    'marital': 'marital_train_unique.pkl', 'month': 'month_train_unique.pkl',
+                    'day_of_week': 'dow_train_unique.pkl'}
+
+
+def stage_key(*parts):
+    """Cache key of a stage: a digest of its parent stage's key and its own settings."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def write_temporary(path, write):
+    """Call write(f) on a temporary file next to `path`, flushed to disk; returns its path."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    return tmp_path
+
+
+def atomic_write(path, write):
+    os.replace(write_temporary(path, write), path)
+
+
+class StageCache:
+    """Runs pipeline stages, reusing results stored on disk under the stage's key.
+
+    Every run, cached or not, is recorded in `timings`.
+    """
+
+    def __init__(self, directory, enabled=True, report=sys.stderr):
+        self.directory = directory
+        self.enabled = enabled
+        self.report = report
+        self.timings = []
+        if enabled:
+            os.makedirs(directory, exist_ok=True)
+
+    def run(self, stage, key, fn):
+        path = os.path.join(self.directory, f"{stage}-{key}.joblib")
+        start = time.perf_counter()
+        cached = self.enabled and os.path.exists(path)
+        if cached:
+            result = joblib.load(path)
+        else:
+            result = fn()
+            if self.enabled:
+                atomic_write(path, lambda f: joblib.dump(result, f))
+        self.timings.append({'stage': stage, 'key': key, 'cached': cached, 'seconds': time.perf_counter() - start})
+        print(f"{stage:<16} {'cached' if cached else 'done':<7} {self.timings[-1]['seconds']:>8.2f} s", file=self.report)
+        return result
+
+    def time(self, stage, fn):
+        """Run a stage that is never cached (e.g. writing the artifacts)."""
+        start = time.perf_counter()
+        result = fn()
+        self.timings.append({'stage': stage, 'key': None, 'cached': False, 'seconds': time.perf_counter() - start})
+        print(f"{stage:<16} {'done':<7} {self.timings[-1]['seconds']:>8.2f} s", file=self.report)
+        return result
+
+
+def feature_names(vocabularies):
+    """Model columns in the order modelling.ipynb builds them."""
+    has_other = dict(ONE_HOT_FIELDS)
+    names = [col for col in INPUT_COLUMNS if col not in has_other and col != 'pdays']
+    for field in ENCODING_ORDER:
+        # pd.get_dummies and OneHotEncoder both emit the categories sorted
+        names += [f"{field}_{value}" for value in sorted(vocabularies[field])]
+        if has_other[field]:
+            names.append(f"{field}_other")
+    return names + ['contact_status']
+
+
+def integer_columns(names):
+    """Columns the notebook holds as int64 (get_dummies output, ordinal codes, contact_status).
+
+    The dtypes matter because SMOTE casts its synthetic rows back to the input dtypes.
+    """
+    prefixes = tuple(f"{field}_" for field, has_other in ONE_HOT_FIELDS if has_other)
+    return [name for name in names if name.startswith(prefixes) or name in CATEGORICAL_MAPPINGS or name == 'contact_status']
+
+
+def split(data_path, config):
+    data = read_frame(data_path).drop(columns=['Unnamed: 0'])
+    return train_test_split(data[INPUT_COLUMNS], data['y'], test_size=config['test_size'],
+                            random_state=config['split_seed'])
+
+
+def clean(x_train, x_test):
+    """Strip the dots from job and fill the missing job/duration values with the training mode/median."""
+    x_train, x_test = x_train.copy(), x_test.copy()
+    for frame in (x_train, x_test):
+        frame['job'] = frame['job'].str.replace('.', '')
+    fill_values = {'job': x_train['job'].mode()[0], 'duration': x_train['duration'].median()}
+    return x_train.fillna(fill_values), x_test.fillna(fill_values), fill_values
+
+
+def prepare(x_train, x_test):
+    """Impute, one-hot encode, map and scale the split the way the notebook does."""
+    x_train, x_test, fill_values = clean(x_train, x_test)
+    vocabularies = {field: x_train[field].unique() for field in VOCABULARY_FILES}
+    scaler = StandardScaler().fit(x_train[NUM_COLS])
+    names = feature_names(vocabularies)
+    encoder = FeatureEncoder(names, vocabularies, CATEGORICAL_MAPPINGS, scaler.mean_, scaler.scale_, num_cols=NUM_COLS)
+    dtypes = {name: np.int64 for name in integer_columns(names)}
+    return {
+        'x_train': encoder.to_frame(encoder.encode_frame(x_train)).astype(dtypes),
+        'x_test': encoder.to_frame(encoder.encode_frame(x_test)).astype(dtypes),
+        'vocabularies': vocabularies,
+        'scaler': scaler,
+        'fill_values': fill_values,
+    }
+
+
+def imblearn_version():
+    """Installed imbalanced-learn version, or None; part of the SMOTE stage's key so an upgrade reruns it."""
+    try:
+        return importlib.metadata.version('imbalanced-learn')
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+
+def oversample(x_train, y_train, seed):
+    try:
+        from imblearn.over_sampling import SMOTE
+    except ImportError:
+        raise SystemExit("Training requires imbalanced-learn (pip install -r requirements_training.txt)")
+    return SMOTE(random_state=seed).fit_resample(x_train, y_train)
+
+
+def grid_search(estimator, grid, x, y, cv, n_jobs):
+    search = GridSearchCV(estimator=estimator, param_grid=grid, cv=cv, n_jobs=n_jobs,
+                          scoring=make_scorer(f1_score, pos_label=POSITIVE_CLASS))
+    search.fit(x, y)
+    return {'best_estimator': search.best_estimator_, 'best_params': search.best_params_,
+            'best_score': search.best_score_}
+
+
+def write_artifacts(output_dir, model, scaler, vocabularies, bundle_path, x_test):
+    """Write the pickles, the compiled model, the bundle and the manifest listing them.
+
+    Every file is first written in full under a temporary name. They are then renamed into
+    place one by one, and the manifest (their SHA-256 digests) last. A crash or a reader
+    between two renames can still see a mix of old and new files, but that mix does not
+    match the manifest, which the API's loader checks before serving a pickle set.
+    """
+    compiled = CompiledForest.from_sklearn(model)
+    verify(model, compiled, x_test)
+    bundle = ModelBundle.from_artifacts(model, {'categorical_mappings': CATEGORICAL_MAPPINGS}, scaler,
+                                        vocabularies['job'], vocabularies['education'], vocabularies['marital'],
+                                        vocabularies['month'], vocabularies['day_of_week'])
+
+    files = {'Bagging_dt.pkl': model, 'standard_scaler.pkl': scaler,
+             'mappings.pkl': {'categorical_mappings': CATEGORICAL_MAPPINGS}}
+    files.update({name: vocabularies[field] for field, name in VOCABULARY_FILES.items()})
+    staged = {os.path.join(output_dir, name): write_temporary(os.path.join(output_dir, name),
+                                                               lambda f, obj=obj: pickle.dump(obj, f))
+              for name, obj in files.items()}
+    npz_path = os.path.join(output_dir, 'Bagging_dt.npz')
+    staged[npz_path] = write_temporary(npz_path, compiled.save)
+    full_bundle_path = os.path.join(output_dir, bundle_path)
+    bundle.save(f"{full_bundle_path}.tmp")
+    staged[full_bundle_path] = f"{full_bundle_path}.tmp"
+
+    manifest = {'version': bundle.version,
+                'files': {os.path.basename(path): file_digest(tmp_path) for path, tmp_path in staged.items()}}
+    manifest_file = os.path.join(output_dir, MANIFEST_NAME)
+    manifest_tmp = write_temporary(manifest_file, lambda f: f.write(json.dumps(manifest, indent=2).encode()))
+    for path, tmp_path in staged.items():
+        os.replace(tmp_path, path)
+    os.replace(manifest_tmp, manifest_file)
+    return [os.path.basename(path) for path in staged] + [MANIFEST_NAME], bundle.version
+
+
+def train(data_path, output_dir='.', config=DEFAULT_CONFIG, cache_dir='.train_cache', use_cache=True, n_jobs=-1,
+          bundle_path=DEFAULT_BUNDLE_PATH, report=sys.stderr):
+    stages = StageCache(cache_dir, enabled=use_cache, report=report)
+    start = time.perf_counter()
+
+    # A dataset directory hashes as the CSV it was converted from, so both share cached stages
+    data_hash = stages.time('hash_data', lambda: source_digest(data_path))
+    x_train, x_test, y_train, y_test = stages.time('split', lambda: split(data_path, config))
+
+    # Each key covers the stage's inputs (through its parent's key) and its own settings
+    prepare_key = stage_key(data_hash, sklearn.__version__, config['test_size'], config['split_seed'],
+                            CATEGORICAL_MAPPINGS)
+    prepared = stages.run('prepare', prepare_key, lambda: prepare(x_train, x_test))
+    smote_key = stage_key(prepare_key, imblearn_version(), config['smote_seed'])
+    x_res, y_res = stages.run('smote', smote_key, lambda: oversample(prepared['x_train'], y_train, config['smote_seed']))
+
+    tree_key = stage_key(smote_key, config['tree_seed'], config['tree_grid'], config['cv'])
+    tree = stages.run('tree_search', tree_key, lambda: grid_search(
+        DecisionTreeClassifier(random_state=config['tree_seed']), config['tree_grid'], x_res, y_res,
+        config['cv'], n_jobs))
+    bagging_key = stage_key(tree_key, config['bagging_seed'], config['bagging_grid'])
+    bagging = stages.run('bagging_search', bagging_key, lambda: grid_search(
+        BaggingClassifier(estimator=tree['best_estimator'], random_state=config['bagging_seed']),
+        config['bagging_grid'], x_res, y_res, config['cv'], n_jobs))
+
+    model = bagging['best_estimator']
+    test_report = stages.time('evaluate', lambda: classification_report(
+        y_test, model.predict(prepared['x_test']), output_dict=True))
+    artifacts, version = stages.time('write_artifacts', lambda: write_artifacts(
+        output_dir, model, prepared['scaler'], prepared['vocabularies'], bundle_path, prepared['x_test']))
+
+    print(classification_report(y_test, model.predict(prepared['x_test'])), file=report)
+    print(f"Trained in {time.perf_counter() - start:.2f} s; bundle version {version}", file=report)
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'data': {'path': data_path, 'sha256': data_hash, 'train_rows': len(x_train), 'test_rows': len(x_test)},
+        'config': config,
+        'fill_values': prepared['fill_values'],
+        'tree': {'best_params': tree['best_params'], 'cv_f1': tree['best_score']},
+        'bagging': {'best_params': bagging['best_params'], 'cv_f1': bagging['best_score']},
+        'test': test_report,
+        'artifacts': artifacts,
+        'bundle_version': version,
+        'timings': stages.timings,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reproduce modelling.ipynb and write the serving artifacts.")
+    parser.add_argument('--data', default='bank_marketing_data.csv',
+                        help="CSV file or dataset directory written by columnar_dataset.py")
+    parser.add_argument('--output-dir', default='.', help="Where the pickles, Bagging_dt.npz and the bundle go")
+    parser.add_argument('--bundle', default=DEFAULT_BUNDLE_PATH, help="Bundle file name inside --output-dir")
+    parser.add_argument('--cache-dir', default='.train_cache', help="Cache of intermediate results")
+    parser.add_argument('--no-cache', action='store_true', help="Recompute every stage and do not store results")
+    parser.add_argument('--jobs', type=int, default=-1, help="Parallel grid search fits (-1: all cores)")
+    parser.add_argument('--report', default='training_report.json', help="Stage timings and scores (JSON)")
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    result = train(args.data, args.output_dir, cache_dir=args.cache_dir, use_cache=not args.no_cache,
+                   n_jobs=args.jobs, bundle_path=args.bundle)
+    with open(args.report, 'w') as f:
+        json.dump(result, f, indent=2, default=str)
+    print(f"Report written to {args.report}", file=sys.stderr)
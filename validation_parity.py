@@ -0,0 +1,186 @@
+import itertools
+import warnings
+
+import pandas as pd
+from pydantic import BaseModel, Field, ValidationError, validator
+
+from feature_encoder import INPUT_COLUMNS
+from schemas import Data, validate_columns, validate_rows
+
+warnings.filterwarnings('ignore', category=DeprecationWarning)
+
+
+# The Data model as it was before the validation layer was rebuilt, kept as the reference behaviour
+class LegacyData(BaseModel):
+    age: int = Field(..., gt=16, le=100, description="Age must be between 17 and 100")
+    job: str = Field(..., description="Job must be a string")
+    marital: str = Field(..., description="Marital status must be a string") 
+    education: str = Field(..., description="Education must be a string")
+    default: str = Field(..., description="Default must be 'no', 'yes', or 'unknown'")
+    housing: str = Field(..., description="Housing must be 'no', 'yes', or 'unknown'")
+    loan: str = Field(..., description="Loan must be 'no', 'yes', or 'unknown'")
+    contact: str = Field(..., description="Contact must be 'cellular' or 'telephone'")
+    month: str = Field(..., description="Month must be 'jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', or 'dec'")
+    day_of_week: str = Field(..., description="Day must be 'mon', 'tue', 'wed', 'thu', or 'fri'")
+    duration: int = Field(..., ge=0, description="Duration must be a non-negative integer")
+    campaign: int = Field(..., ge=0, description="Campaign must be a non-negative integer")
+    pdays: int = Field(..., ge=0, le=999, description="Pdays must be a non-negative integer or 999 if never contacted")
+    previous: int = Field(..., ge=0, description="Previous must be a non-connegative integer")
+    poutcome: str = Field(..., description="Poutcome must be 'failure', 'nonexistent', or 'success'")
+
+    # Validator to prevent empty string inputs
+    @validator('default', 'housing', 'loan', 'contact', 'poutcome', 'month', 'day_of_week', 'education', 'job', 'marital')
+    def check_not_empty(cls, v):
+        if not v:
+            raise ValueError("Field cannot be empty")
+        return v
+
+    # Validation to prevent the education and job inputs from remaining as "string"
+    @validator('education', 'job')
+    def check_not_empty_string(cls, v):
+        if v in {'string'}:  
+            raise ValueError("Field must be filled in accordance")
+        return v 
+
+    # Education input must only contain lowercase letters a-z, digits, and dots
+    @validator('education')
+    def education_validator(cls, v):
+        if any(char not in 'abcdefghijklmnopqrstuvwxyz0123456789.' for char in v.lower()):
+            raise ValueError("Education must only contain lowercase letters a-z, digits, and dots. Use dot for space! (e.g. high.school)")
+        return v
+
+    # Job input must only contain lowercase letters a-z, dots, and dashes
+    @validator('job')
+    def job_validator(cls, v):
+        if any(char not in 'abcdefghijklmnopqrstuvwxyz.-' for char in v.lower()):
+            raise ValueError("Job must only contain lowercase letters a-z, dash, and dots. Use dot for space! (e.g. private.chef)")
+        return v
+
+    # To handle inputs that end with a non-alphabetic character, such as 'admin.'
+    @validator('education', 'job')
+    def trim_invalid_ending_char(cls, v):
+        while len(v) > 0 and v[-1] not in 'abcdefghijklmnopqrstuvwxyz':
+            v = v[:-1]
+        return v
+
+    # Input is validated to be one of "default," "housing," or "loan."
+    @validator('default', 'housing', 'loan')
+    def check_boolean_strings(cls, v):
+        if v not in {'no', 'yes', 'unknown'}:
+            raise ValueError("Must be 'no', 'yes', or 'unknown'")
+        return v
+
+    # Input is validated to be one of "divorced," "married," "single," or "unknown"
+    @validator('marital')
+    def check_marital(cls, v):
+        if v not in {'divorced', 'married', 'single', 'unknown'}:
+            raise ValueError("Must be 'divorced', 'married', 'single', or 'unknown', If you want to input 'widowed', type 'divorced' instead")
+        return v
+
+    # Input is validated to be either "cellular" or "telephone"
+    @validator('contact')
+    def check_contact(cls, v):
+        if v not in {'cellular', 'telephone'}:
+            raise ValueError("Must be 'cellular' or 'telephone'")
+        return v
+    
+    # Input is validated to be either "failure," "nonexistent," or "success"
+    @validator('poutcome')
+    def check_poutcome(cls, v):
+        if v not in {'failure', 'nonexistent', 'success'}:
+            raise ValueError("Must be 'failure', 'nonexistent', or 'success'")
+        return v
+
+    # The input must be the first 3 characters of the month name
+    @validator('month')
+    def check_month(cls, v):
+        if v not in {'jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'}:
+            raise ValueError("Must be 'jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', or 'dec'")
+        return v
+    
+    # The input must consist of the first 3 characters of the day name and be between Monday and Friday.
+    @validator('day_of_week')
+    def check_day_of_week(cls, v):
+        if v not in {'mon', 'tue', 'wed', 'thu', 'fri'}:
+            raise ValueError("Must be 'mon', 'tue', 'wed', 'thu', or 'fri'")
+        return v
+
+
+# Values tried in every text / integer field on top of the valid rows of bank_marketing_data.csv
+TEXT_PROBES = ['', 'string', 'String', 'admin.', 'Admin.', 'ADMIN', 'admin..', '...', '.', '-', 'blue-collar', 'blue collar',
+               'private.chef', 'high.school', 'High.School', 'basic.4y', 'basic.4y.', '4y', 'self-employed-', 'admin\n',
+               '\u0130', '\u00e9t\u00e9', 'no', 'yes', 'unknown', 'Yes', ' no', 'married', 'widowed', 'cellular',
+               'failure', 'nonexistent', 'non-existent', 'jan', 'JAN', 'january', 'mon', 'sat', None, 5, 5.5, True, [], {}]
+INT_PROBES = [-1, 0, 16, 17, 100, 101, 998, 999, 1000, '42', ' 42', 42.0, 42.5, 'abc', '', None, True, float('nan'), 10 ** 20]
+
+
+def corpus(csv_path='bank_marketing_data.csv', n_base=200):
+    data = pd.read_csv(csv_path, usecols=INPUT_COLUMNS).dropna()
+    data['job'] = data['job'].str.replace('.', '')
+    base = data.head(n_base).to_dict('records')
+    rows = list(base)
+    for row, field in zip(itertools.cycle(base), INPUT_COLUMNS * 2):
+        probes = INT_PROBES if field in ('age', 'duration', 'campaign', 'pdays', 'previous') else TEXT_PROBES
+        rows.extend({**row, field: value} for value in probes)
+    rows.append({k: v for k, v in base[0].items() if k != 'job'})
+    rows.append({**base[0], 'extra': 1})
+    rows.append({**base[0], 'job': '', 'month': 'sat', 'age': 5})
+    return rows
+
+
+def legacy_validate(row):
+    try:
+        return LegacyData(**row).dict(), None
+    except ValidationError as e:
+        return None, e.errors(include_url=False, include_context=False)
+
+
+def compare(rows):
+    """Return a list of (row, legacy result, new result) for every row on which the two layers disagree."""
+    legacy = [legacy_validate(row) for row in rows]
+    mismatches = []
+
+    # Single-record path (Data model)
+    for row, expected in zip(rows, legacy):
+        try:
+            actual = Data(**row).dict(), None
+        except ValidationError as e:
+            actual = None, e.errors(include_url=False, include_context=False)
+        if repr(actual) != repr(expected):
+            mismatches.append((row, expected, actual))
+
+    # Batch path (validate_rows)
+    valid_index, valid_rows, errors = validate_rows(rows)
+    actual = [None] * len(rows)
+    for i, values in zip(valid_index, valid_rows):
+        actual[i] = values, None
+    for entry in errors:
+        actual[entry['index']] = None, entry['detail']
+    for row, expected, result in zip(rows, legacy, actual):
+        if repr(result) != repr(expected):
+            mismatches.append((row, expected, result))
+
+    # Columnar path (validate_columns), on the rows that have every field (a column cannot skip a row)
+    complete = [i for i, row in enumerate(rows) if all(col in row for col in INPUT_COLUMNS)]
+    columns = {col: [rows[i][col] for i in complete] for col in INPUT_COLUMNS}
+    valid_index, valid_columns, errors = validate_columns(columns, len(complete))
+    actual = [None] * len(complete)
+    for position, i in enumerate(valid_index):
+        actual[i] = {col: valid_columns[col][position].item() if hasattr(valid_columns[col][position], 'item')
+                     else valid_columns[col][position] for col in INPUT_COLUMNS}, None
+    for entry in errors:
+        actual[entry['index']] = None, entry['detail']
+    for i, result in zip(complete, actual):
+        if repr(result) != repr(legacy[i]):
+            mismatches.append((rows[i], legacy[i], result))
+    return mismatches
+
+
+if __name__ == "__main__":
+    rows = corpus()
+    mismatches = compare(rows)
+    for row, expected, actual in mismatches[:10]:
+        print(f"{row}\n  old: {expected}\n  new: {actual}")
+    n_invalid = sum(legacy_validate(row)[1] is not None for row in rows)
+    print(f"{len(rows)} inputs ({n_invalid} invalid), {len(mismatches)} mismatches")
+    raise SystemExit(1 if mismatches else 0)
@@ -0,0 +1,242 @@
+import json
+
+import numpy as np
+import orjson
+import pandas as pd
+from fastapi.responses import JSONResponse
+
+from feature_encoder import INPUT_COLUMNS
+from schemas import format_error_detail
+
+# Media types of /predict/batch bodies and responses. The binary formats are columnar: one array per
+# field, decoded straight into NumPy arrays for validate_columns and FeatureEncoder.encode_columns.
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+ARROW = 'application/vnd.apache.arrow.stream'
+MEDIA_TYPES = {JSON: JSON, MSGPACK: MSGPACK, 'application/x-msgpack': MSGPACK, ARROW: ARROW}
+
+
+class UnsupportedFormat(ValueError):
+    pass
+
+
+def _msgpack():
+    try:
+        import msgpack
+    except ImportError:
+        raise UnsupportedFormat("MessagePack bodies require msgpack (pip install msgpack)")
+    return msgpack
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise UnsupportedFormat("Arrow bodies require pyarrow (pip install pyarrow)")
+    return pa
+
+
+def negotiate(header, default=JSON):
+    """The first supported media type listed in a Content-Type or Accept header; `default` if it is empty or */*."""
+    for part in header.split(','):
+        name = part.split(';')[0].strip().lower()
+        if name in MEDIA_TYPES:
+            return MEDIA_TYPES[name]
+        if name in ('', '*/*', 'application/*'):
+            return default
+    raise UnsupportedFormat(f"Unsupported media type {header!r}; use {JSON}, {MSGPACK} or {ARROW}")
+
+
+def _plain(value):
+    if isinstance(value, np.ndarray):
+        return [None if item != item else item for item in value.tolist()]
+    return str(value)
+
+
+def dumps_json(content):
+    """JSON bytes via orjson (NumPy arrays written directly, NaN as null).
+
+    Falls back to the json module for what orjson refuses, such as an integer beyond 64 bits
+    echoed back in a validation error.
+    """
+    try:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS, default=str)
+    except orjson.JSONEncodeError:
+        return json.dumps(content, default=_plain, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode()
+
+
+# Maps every digit byte to b'1' and everything else to b'0'
+_DIGIT_MASK = bytes(49 if 48 <= code <= 57 else 48 for code in range(256))
+
+
+def loads_json(body):
+    """Parsed JSON via orjson, giving the same result as the json module FastAPI uses for every other endpoint.
+
+    orjson reads integers beyond 64 bits as floats and refuses NaN/Infinity literals, so bodies with a
+    19+ digit run (a few ms to find) or that it rejects go to the json module. Raises json.JSONDecodeError.
+    """
+    if b'1' * 19 in body.translate(_DIGIT_MASK):
+        return json.loads(body)
+    try:
+        return orjson.loads(body)
+    except orjson.JSONDecodeError as e:
+        try:
+            return json.loads(body)
+        except UnicodeDecodeError:
+            raise e
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content):
+        return dumps_json(content)
+
+
+def _row_count(columns):
+    lengths = {len(values) for values in columns.values()}
+    if len(lengths) > 1:
+        raise ValueError("All columns must have the same length")
+    return lengths.pop() if lengths else 0
+
+
+# MessagePack layout: {"columns": {field: column}}, where a column is a plain array of values,
+# a typed array {"dtype": "<i8", "data": <bin>} (read in place, no object per value), or a
+# dictionary-encoded column {"categories": [...], "codes": <typed array>} with code -1 for missing.
+
+def _typed_array(value):
+    dtype = np.dtype(value['dtype'])
+    if dtype.kind not in 'biuf':
+        raise ValueError(f"Unsupported dtype {value['dtype']!r}")
+    return np.frombuffer(value['data'], dtype=dtype)
+
+
+def _msgpack_column(value):
+    if isinstance(value, dict) and 'codes' in value:
+        return pd.Categorical.from_codes(_typed_array(value['codes']).astype(np.int64), value['categories'])
+    if isinstance(value, dict):
+        return _typed_array(value)
+    if isinstance(value, list):
+        return value
+    raise ValueError("A column must be an array, a typed array or a dictionary-encoded column")
+
+
+def _pack_array(array):
+    array = np.ascontiguousarray(array)
+    return {'dtype': array.dtype.newbyteorder('<').str, 'data': array.astype(array.dtype.newbyteorder('<')).tobytes()}
+
+
+def decode_msgpack(body):
+    payload = _msgpack().unpackb(body)
+    if not isinstance(payload, dict) or not isinstance(payload.get('columns'), dict):
+        raise ValueError("Expected a map with a 'columns' map of field -> column")
+    columns = {name: _msgpack_column(value) for name, value in payload['columns'].items()}
+    return columns, _row_count(columns)
+
+
+def decode_arrow(body):
+    pa = _pyarrow()
+    table = pa.ipc.open_stream(body).read_all()
+    columns = {}
+    for name in table.column_names:
+        column = table.column(name)
+        if pa.types.is_dictionary(column.type):
+            columns[name] = column.to_pandas().array
+        elif column.null_count == 0 and (pa.types.is_integer(column.type) or pa.types.is_floating(column.type)):
+            # Zero-copy for a single chunk
+            columns[name] = column.to_numpy()
+        elif pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+            columns[name] = column.to_numpy(zero_copy_only=False)
+        else:
+            # Nulls in a numeric column become None (not NaN), so they fail validation as JSON nulls do
+            columns[name] = column.to_pylist()
+    return columns, table.num_rows
+
+
+def decode_columns(body, media_type):
+    """(field -> column, number of rows) for a MessagePack or Arrow IPC stream body."""
+    if media_type == MSGPACK:
+        return decode_msgpack(body)
+    if media_type == ARROW:
+        return decode_arrow(body)
+    raise UnsupportedFormat(f"{media_type} is not a columnar format")
+
+
+def encode_predictions(media_type, n_rows, valid_index, labels, probabilities, errors, classes):
+    """Response body for /predict/batch: per-row prediction and "yes" probability (null for invalid rows) and the errors.
+
+    JSON keeps the {"predictions", "probabilities", "errors"} shape. MessagePack uses the same keys with
+    predictions dictionary-encoded over `classes` and probabilities as a float64 typed array (NaN for
+    invalid rows). Arrow returns one record batch with prediction, probability and error columns,
+    like batch_score.py's output.
+    """
+    classes = [str(label) for label in classes]
+    codes = np.full(n_rows, -1, dtype=np.int8)
+    codes[valid_index] = pd.Categorical(labels, categories=classes).codes
+    probability = np.full(n_rows, np.nan)
+    probability[valid_index] = probabilities
+
+    if media_type == JSON:
+        predictions = np.append(np.asarray(classes, dtype=object), None)[codes]
+        return dumps_json({"predictions": predictions.tolist(), "probabilities": probability, "errors": errors})
+    if media_type == MSGPACK:
+        return _msgpack().packb({"predictions": {"categories": classes, "codes": _pack_array(codes)},
+                                 "probabilities": _pack_array(probability), "errors": errors}, default=str)
+    if media_type == ARROW:
+        pa = _pyarrow()
+        error = np.full(n_rows, None, dtype=object)
+        for entry in errors:
+            error[entry['index']] = format_error_detail(entry['detail'])
+        valid = codes >= 0
+        batch = pa.RecordBatch.from_arrays([
+            pa.DictionaryArray.from_arrays(pa.array(codes, mask=~valid), pa.array(classes)),
+            pa.array(probability, mask=~valid),
+            pa.array(error, type=pa.string()),
+        ], names=['prediction', 'probability', 'error'])
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, batch.schema) as writer:
+            writer.write_batch(batch)
+        return sink.getvalue().to_pybytes()
+    raise UnsupportedFormat(f"Unsupported media type {media_type!r}")
+
+
+# Client side: what a bulk client sends and reads back (used by benchmark_wire.py)
+
+def encode_request(frame, media_type):
+    """Body for /predict/batch with the rows of a DataFrame holding the raw input columns."""
+    frame = frame[INPUT_COLUMNS]
+    if media_type == JSON:
+        return orjson.dumps({"columns": {name: frame[name].tolist() for name in INPUT_COLUMNS}})
+    if media_type == MSGPACK:
+        columns = {}
+        for name in INPUT_COLUMNS:
+            if frame[name].dtype == object:
+                codes, categories = pd.factorize(frame[name])
+                columns[name] = {"categories": categories.tolist(), "codes": _pack_array(codes.astype(np.int16))}
+            else:
+                columns[name] = _pack_array(frame[name].to_numpy())
+        return _msgpack().packb({"columns": columns})
+    if media_type == ARROW:
+        pa = _pyarrow()
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        table = pa.table({name: column.dictionary_encode() if pa.types.is_string(column.type) else column
+                          for name, column in zip(table.column_names, table.columns)})
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+    raise UnsupportedFormat(f"Unsupported media type {media_type!r}")
+
+
+def decode_predictions(body, media_type):
+    """DataFrame of prediction and probability per row (None/NaN for invalid rows) from a /predict/batch response."""
+    if media_type == JSON:
+        payload = orjson.loads(body)
+        return pd.DataFrame({'prediction': payload['predictions'],
+                             'probability': np.array(payload['probabilities'], dtype=np.float64)})
+    if media_type == MSGPACK:
+        payload = _msgpack().unpackb(body)
+        return pd.DataFrame({'prediction': _msgpack_column(payload['predictions']),
+                             'probability': _typed_array(payload['probabilities'])})
+    if media_type == ARROW:
+        table = _pyarrow().ipc.open_stream(body).read_all()
+        return table.select(['prediction', 'probability']).to_pandas()
+    raise UnsupportedFormat(f"Unsupported media type {media_type!r}")